@@ -0,0 +1,225 @@
+"""
+Many binary game logs (see gamelog.py) in a single file, with an index so that any
+one game can be read without reading the others.
+
+Layout (all integers unsigned, big-endian):
+    ARCHIVE_MAGIC, then the binary logs one after another, then the index, which
+    holds the offset (8 bytes) and length (4 bytes) of each log in order, then
+    the trailer: the offset of the index (8 bytes) and the number of logs (4 bytes).
+
+Archives are read through mmap, so opening one costs the same however many games
+it holds, and only the pages of the games actually looked at are ever read.
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import gamelog
+import replay
+
+ARCHIVE_MAGIC = b'HSA\x01'
+INDEX_ENTRY = struct.Struct('>QI')
+TRAILER = struct.Struct('>QI')
+#the most a log's header can take: player count, then protocol, name length, name per player
+MAX_SETUP_SIZE = len(gamelog.MAGIC) + 1 + 5 * (2 + 255)
+
+
+def write_archive(path, logs):
+    """
+    Write the binary logs in logs (any iterable of bytes) to a new archive at path.
+    Return the number of logs written.
+    """
+    index = []
+    with open(path, 'wb') as outfile:
+        outfile.write(ARCHIVE_MAGIC)
+        offset = len(ARCHIVE_MAGIC)
+        for data in logs:
+            outfile.write(data)
+            index.append((offset, len(data)))
+            offset += len(data)
+        for entry in index:
+            outfile.write(INDEX_ENTRY.pack(*entry))
+        outfile.write(TRAILER.pack(offset, len(index)))
+    return len(index)
+
+
+class Archive:
+    """
+    An archive opened for reading.  archive[n] is the binary log of game n
+    (counting from 0); use as a context manager, or call close, when done.
+    """
+    def __init__(self, path):
+        """
+        Raises ValueError if the file at path is not an archive, or is cut short.
+        """
+        self.path = path
+        with open(path, 'rb') as infile:
+            if os.fstat(infile.fileno()).st_size < len(ARCHIVE_MAGIC) + TRAILER.size:
+                raise ValueError(f'{path} is not a hanabi-sim archive (too short).')
+            self.map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+            self.map.close()
+            raise ValueError(f'{path} is not a hanabi-sim archive.')
+        self.index_offset, self.count = TRAILER.unpack_from(self.map, len(self.map) - TRAILER.size)
+        #the index runs from its offset right up to the trailer
+        if self.index_offset < len(ARCHIVE_MAGIC) or \
+           self.index_offset + self.count * INDEX_ENTRY.size != len(self.map) - TRAILER.size:
+            size = len(self.map)
+            self.map.close()
+            raise ValueError(f'{path} is damaged or cut short: its index (of {self.count} games, '\
+                             f'at {self.index_offset}) does not fit in its {size} bytes.')
+
+    def entry(self, n):
+        """
+        The offset and length of game n.  Raises IndexError if there is no game n, and
+        ValueError if its entry in the index lies outside the logs.
+        """
+        if not 0 <= n < self.count:
+            raise IndexError(f'There is no game {n}; number of games: {self.count}')
+        offset, length = INDEX_ENTRY.unpack_from(self.map, self.index_offset + n * INDEX_ENTRY.size)
+        if offset < len(ARCHIVE_MAGIC) or offset + length > self.index_offset:
+            raise ValueError(f'{self.path} is damaged: game {n} (at {offset}, {length} bytes) '\
+                             f'lies outside the logs.')
+        return offset, length
+
+    def __getitem__(self, n):
+        offset, length = self.entry(n)
+        return self.map[offset:offset + length]
+
+    def __len__(self):
+        return self.count
+
+    def players(self, n):
+        """
+        The player names of game n, read from the header of its log alone.
+        """
+        offset, length = self.entry(n)
+        players, _, _ = gamelog.decode_setup(self.map[offset:offset + min(length, MAX_SETUP_SIZE)])
+        return players
+
+    def find(self, names):
+        """
+        Yield the number of each game in which all the given players (compared
+        without regard to case) took part.
+        """
+        names = {name.lower() for name in names}
+        for n in range(self.count):
+            if names <= {player.lower() for player in self.players(n)}:
+                yield n
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def summarize_games(path, numbers):
+    """
+    Replay the given games of the archive at path; return (number, ReplaySummary) pairs.
+    """
+    with Archive(path) as archive:
+        return [(n, replay.ReplaySummary(f'{path}#{n}', gamelog.replay_binary(archive[n])))
+                for n in numbers]
+
+def replay_archive(path, numbers=None, jobs=None, chunk_size=256):
+    """
+    Replay the given games (by default, all) of the archive at path across a pool
+    of jobs worker processes, each of which maps the archive itself.  Yield
+    (number, ReplaySummary) pairs as chunks of chunk_size games finish.
+    """
+    if numbers is None:
+        with Archive(path) as archive:
+            numbers = range(len(archive))
+    numbers = list(numbers)
+    if jobs == 1 or len(numbers) <= 1:
+        yield from summarize_games(path, numbers)
+        return
+    chunks = [numbers[i:i + chunk_size] for i in range(0, len(numbers), chunk_size)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(summarize_games, path, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def read_log(path):
+    """
+    The binary form of the log at path, which may be binary already or text, and the
+    errors (ReplayErrors) of the lines of a text log which were dropped, as in
+    gamelog.encode_text.  Raises ValueError if a text log has no game.
+    """
+    with open(path, 'rb') as infile:
+        data = infile.read()
+    if data.startswith(gamelog.MAGIC):
+        return data, []
+    data, result = gamelog.encode_text(data.decode().splitlines())
+    if data is None:
+        raise ValueError(f'{path}: no game (setup incomplete)')
+    return data, result.errors
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='archive',
+                                     description='Build and read archives of hanabi-sim games',
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create', help='build an archive from logs (text or binary)')
+    create.add_argument('archive')
+    create.add_argument('logs', nargs='+', help='logs, directories of logs, or glob patterns')
+    listing = commands.add_parser('list', help='list the games in an archive and their players')
+    listing.add_argument('archive')
+    listing.add_argument('-p', '--player', action='append', default=[],
+                         help='only games with this player (may be repeated)')
+    extract = commands.add_parser('extract', help='print one game as a text log')
+    extract.add_argument('archive')
+    extract.add_argument('number', type=int)
+    replaying = commands.add_parser('replay', help='replay games and summarize them')
+    replaying.add_argument('archive')
+    replaying.add_argument('numbers', nargs='*', type=int, help='games to replay (default: all)')
+    replaying.add_argument('-j', '--jobs', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command != 'create':
+        #report an archive which can't be read before doing anything with it
+        try: Archive(args.archive).close()
+        except (OSError, ValueError) as e:
+            print(e, file=sys.stderr)
+            exit(1)
+
+    match args.command:
+        case 'create':
+            paths = replay.expand_paths(args.logs)
+            def logs():
+                for path in paths:
+                    try: data, errors = read_log(path)
+                    except (OSError, UnicodeDecodeError, ValueError) as e:
+                        print(f'skipped {path}: {e}', file=sys.stderr)
+                        continue
+                    for error in errors:
+                        print(f'{path}: dropped {error}', file=sys.stderr)
+                    yield data
+            print(f'{write_archive(args.archive, logs())} games written to {args.archive}')
+        case 'list':
+            with Archive(args.archive) as archive:
+                numbers = archive.find(args.player) if args.player else range(len(archive))
+                for n in numbers:
+                    print(f'{n}: {", ".join(archive.players(n))}')
+        case 'extract':
+            with Archive(args.archive) as archive:
+                try: print('\n'.join(gamelog.decode_text(archive[args.number])))
+                except (IndexError, ValueError) as e:
+                    print(e.args[0])
+                    exit(1)
+        case 'replay':
+            failed = False
+            for n, summary in replay_archive(args.archive, args.numbers or None, jobs=args.jobs):
+                failed = failed or not summary.ok()
+                print(summary, flush=True)
+            exit(1 if failed else 0)
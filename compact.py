@@ -0,0 +1,273 @@
+"""
+A compact form of a game's public state, for bulk work (simulating or analysing many
+games) where building GameState, Player, Hand and UnknownCard objects for every version
+of every game would cost too much.  A CompactState is a handful of fixed-size arrays:
+    masks       the identity mask (see game_objects) of every card, hand after hand, each
+                hand given the starting hand size; sizes holds how many cards each has
+    outstanding the number of copies of each identity outstanding, by card_index
+    played      the number on top of each firework, in Color order (0 if none)
+    discarded   the number of copies of each identity discarded, by card_index
+with the hints, misfires, player up, round, cards left in the deck, and whether the game
+is over alongside them.
+
+hint, play and discard apply the rules to a CompactState as the Player methods do to a
+GameState, raising the same exceptions, and return a new CompactState; a hint updates the
+whole of the hinted hand at once by masking.  from_game_state and to_game_state convert
+between the two forms, so that the REPL and the analytics can each use the one suited to
+them.  Only public information is kept: how the cards came to be as they are (their
+histories and guesses) and the log of actions are not, and to_game_state gives fresh cards
+with the right masks and an empty action log.
+"""
+from array import array
+
+from game_objects import *
+
+
+class CompactState:
+    """
+    The public state of a game as fixed-size arrays; see the module docstring.
+    names and protocols are tuples shared by every version of a game.
+    """
+    __slots__ = ('names', 'protocols', 'hand_size', 'masks', 'sizes', 'outstanding', 'played',
+                 'discarded', 'hints', 'misfires', 'player_up', 'round', 'num_in_deck', 'over')
+
+    def __init__(self, names, protocols):
+        num_players = len(names)
+        if not GameState.MIN_PLAYERS <= num_players <= GameState.MAX_PLAYERS:
+            raise HanabiRulesException(f'Invalid number ({num_players}) of players; '\
+                                       f'{GameState.MIN_PLAYERS} to {GameState.MAX_PLAYERS} allowed.')
+        if len(protocols) != num_players:
+            raise HanabiSimException(f'There must be exactly one protocol per player (players: '\
+                                     f'{num_players}; protocols: {len(protocols)})')
+        self.names = tuple(names)
+        self.protocols = tuple(protocols)
+        self.hand_size = GameState.HAND_SIZES[num_players]
+        self.masks = array('L', [ALL_IDENTITIES] * (self.hand_size * num_players))
+        self.sizes = array('B', [self.hand_size] * num_players)
+        self.outstanding = array('B', [CARD_FREQUENCIES[n - MIN_CARD_VALUE] for color in Color
+                                       for n in range(MIN_CARD_VALUE, MAX_CARD_VALUE + 1)])
+        self.played = array('B', [0] * len(Color))
+        self.discarded = array('B', [0] * NUM_IDENTITIES)
+        self.hints = GameState.STARTING_HINTS
+        self.misfires = GameState.STARTING_MISFIRES
+        self.player_up = GameState.STARTING_PLAYER_UP
+        self.round = GameState.STARTING_ROUND
+        self.num_in_deck = sum(self.outstanding) - len(self.masks)
+        self.over = False
+
+    @property
+    def num_players(self):
+        return len(self.names)
+
+    def copy(self):
+        """
+        A new version of this state for a rule to modify; the arrays are copied, which
+        for arrays this size is a single allocation each.
+        """
+        cpy = CompactState.__new__(CompactState)
+        cpy.names, cpy.protocols, cpy.hand_size = self.names, self.protocols, self.hand_size
+        cpy.masks = self.masks[:]
+        cpy.sizes = self.sizes[:]
+        cpy.outstanding = self.outstanding[:]
+        cpy.played = self.played[:]
+        cpy.discarded = self.discarded[:]
+        cpy.hints, cpy.misfires = self.hints, self.misfires
+        cpy.player_up, cpy.round = self.player_up, self.round
+        cpy.num_in_deck, cpy.over = self.num_in_deck, self.over
+        return cpy
+
+    def hand(self, player_index):
+        """
+        The masks of the cards in a player's hand, in order.
+        """
+        start = player_index * self.hand_size
+        return self.masks[start:start + self.sizes[player_index]]
+
+    def score(self):
+        return sum(self.played)
+
+    def advance_turn(self):
+        self.player_up += 1
+        self.round += self.player_up // self.num_players
+        self.player_up = self.player_up % self.num_players
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactState): return False
+        return all([getattr(self, field) == getattr(other, field) for field in self.__slots__])
+
+    def __str__(self):
+        hands = [f'{name}: ' + ' '.join([f'{mask:07x}' for mask in self.hand(p)])
+                 for p, name in enumerate(self.names)]
+        return f'Round {self.round}, player up: {self.names[self.player_up]}, '\
+               f'hints: {self.hints}, misfires: {self.misfires}, score: {self.score()}\n'\
+               + '\n'.join(hands)
+
+
+def check_card(state, position, card):
+    """
+    Raise HanabiIndexException unless the player up could have card at position.
+    """
+    size = state.sizes[state.player_up]
+    if not 0 <= position < size:
+        raise HanabiIndexException(position, 'the position given was not in range.\n'\
+                                   f'Expected an integer between 1 and {size}, inclusive.')
+    if not state.masks[state.player_up * state.hand_size + position] >> card.index & 1:
+        raise HanabiIndexException(position, f'The card identity {card} which you gave was '\
+                                   f'not possible given prior hints.')
+
+def remove_outstanding(state, card):
+    if not state.outstanding[card.index]:
+        raise HanabiSimException(f'The card you specified, {card}, is exhausted '\
+                                 f'by prior plays and discards. (see "show outstanding")')
+    state.outstanding[card.index] -= 1
+
+def replenish(state, position):
+    """
+    Take the card at position from the hand of the player up, and draw a new one if the
+    deck has any left, placing it according to the player's replenishment protocol.
+    """
+    player = state.player_up
+    start, size = player * state.hand_size, state.sizes[player]
+    hand = state.masks[start:start + size]
+    if not state.num_in_deck:
+        del hand[position]
+        state.sizes[player] -= 1
+    else:
+        state.num_in_deck -= 1
+        match state.protocols[player]:
+            case 'left_shift':
+                del hand[position]
+                hand.append(ALL_IDENTITIES)
+            case 'right_shift':
+                del hand[position]
+                hand.insert(0, ALL_IDENTITIES)
+            case 'in_place':
+                hand[position] = ALL_IDENTITIES
+            case _:
+                raise HanabiSimException('Illegal replenishment protocol')
+    state.masks[start:start + size] = hand + array('L', [0] * (size - len(hand)))
+
+def hint(state, target_index, positions, value):
+    """
+    The state after the player up hints value (a Color or number) to the player at
+    target_index, about the cards at positions (a mask, bit p for position p).
+    """
+    if state.hints <= 0:
+        raise HanabiRulesException('Cannot give a hint while no hints remain!')
+    if target_index == state.player_up:
+        raise HanabiRulesException('One cannot give a hint to oneself!')
+    if isinstance(value, Color):
+        keep = COLOR_MASKS[value]
+    elif value in NUMBER_MASKS:
+        keep = NUMBER_MASKS[value]
+    else:
+        raise HanabiSimException(f'Invalid hint given: {value}')
+    if not positions: raise HanabiSimException(f'You must specify the positions hinted.')
+    size = state.sizes[target_index]
+    if positions >> size:
+        position = positions.bit_length() - 1
+        raise HanabiIndexException(position, f'no such card; position out of range.\n' \
+                                   f'Expected integer between 1 and {size}, inclusive.')
+    new_state = state.copy()
+    start = target_index * state.hand_size
+    #hinted cards keep only the identities hinted, the others only those not hinted
+    hand = [mask & (keep if positions >> p & 1 else ~keep)
+            for p, mask in enumerate(state.masks[start:start + size])]
+    if not all(hand):
+        position = hand.index(0)
+        raise HanabiIndexException(position, 'Inconsistent hints: the hint rules out every '\
+                                   'identity left for a card.')
+    new_state.masks[start:start + size] = array('L', hand)
+    new_state.hints -= 1
+    new_state.advance_turn()
+    return new_state
+
+def play(state, position, card):
+    """
+    The state after the player up plays card from position, successfully or not.
+    """
+    check_card(state, position, card)
+    new_state = state.copy()
+    remove_outstanding(new_state, card)
+    color = card.color.value - 1
+    if card.number == new_state.played[color] + 1:
+        new_state.played[color] = card.number
+        if card.number == MAX_CARD_VALUE:
+            new_state.hints += 1 if new_state.hints < GameState.MAX_HINTS else 0
+            if all([top == MAX_CARD_VALUE for top in new_state.played]):
+                new_state.over = True
+    else:
+        new_state.misfires += 1
+        new_state.over = new_state.misfires > GameState.MAX_MISFIRES
+        new_state.hints += 1 if new_state.hints < GameState.MAX_HINTS else 0
+        new_state.discarded[card.index] += 1
+    replenish(new_state, position)
+    new_state.advance_turn()
+    return new_state
+
+def discard(state, position, card):
+    """
+    The state after the player up discards card from position.
+    """
+    if state.hints == GameState.MAX_HINTS:
+        raise HanabiRulesException('Cannot discard while hints are at maximum!')
+    check_card(state, position, card)
+    new_state = state.copy()
+    remove_outstanding(new_state, card)
+    new_state.hints += 1
+    new_state.discarded[card.index] += 1
+    replenish(new_state, position)
+    new_state.advance_turn()
+    return new_state
+
+
+def from_game_state(game):
+    """
+    The CompactState of a GameState.
+    """
+    state = CompactState.__new__(CompactState)
+    state.names = tuple([player.name for player in game.players])
+    state.protocols = tuple([player.replenishment_protocol for player in game.players])
+    state.hand_size = GameState.HAND_SIZES[game.num_players]
+    state.masks = array('L', [0] * (state.hand_size * game.num_players))
+    for p, player in enumerate(game.players):
+        state.masks[p * state.hand_size:p * state.hand_size + len(player.hand)] = \
+            array('L', [card.mask for card in player.hand.hand])
+    state.sizes = array('B', [len(player.hand) for player in game.players])
+    state.outstanding = array('B', game.outstanding_cards.counts)
+    state.played = array('B', [game.play[color].number for color in Color])
+    state.discarded = array('B', [0] * NUM_IDENTITIES)
+    for cards in game.discard.cards.values():
+        for card in cards:
+            state.discarded[card.index] += 1
+    state.hints, state.misfires = game.hints, game.misfires
+    state.player_up, state.round = game.player_up, game.round
+    state.num_in_deck, state.over = game.num_in_deck, game.over
+    return state
+
+def to_game_state(state):
+    """
+    A GameState with the public state of a CompactState: fresh cards with the same masks,
+    and an empty action log.
+    """
+    game = GameState(list(state.names), list(state.protocols))
+    for p, player in enumerate(game.players):
+        hand = Hand(0)
+        for mask in state.hand(p):
+            card = UnknownCard(state.round, '-')
+            card.mask = mask
+            hand.hand.append(card)
+        player.hand = hand
+    for i, count in enumerate(state.outstanding):
+        game.outstanding_cards.counts[i] = count
+    game.outstanding_cards.total = sum(state.outstanding)
+    for color, top in zip(Color, state.played):
+        game.play.cards[color] = Card(color, top)
+    for i, count in enumerate(state.discarded):
+        for _ in range(count):
+            game.discard = game.discard.add(card_at_index(i))
+    game.hints, game.misfires = state.hints, state.misfires
+    game.player_up, game.round = state.player_up, state.round
+    game.num_in_deck, game.over = state.num_in_deck, state.over
+    game.rehash()
+    return game
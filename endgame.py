@@ -0,0 +1,362 @@
+"""
+Analysis of the end of a game, once few cards are left in the deck: for each move open to
+the player up, the best score the players could still reach after making it.
+
+The hidden cards are dealt at random consistently with public information, as in
+sampler.py, and the rest of the deck is shuffled.  Each such deal is a game of perfect
+information with few turns left, which is searched exhaustively:
+    - positions are hashed Zobrist-style and looked up in a transposition table, with
+      the cards in each hand taken as unordered and cards which can no longer be played
+      all treated alike, so that the many orders in which the same position can be
+      reached are searched only once;
+    - a move is skipped when even the most optimistic score after it (every card still
+      missing from a firework played, as far as the turns left allow) would not beat a
+      move already found, and a search stops early when a move reaches that bound.
+The scores found for each move are averaged over the deals, with the deals' weights.
+Deals are searched until a time budget runs out.  As players only ever see their own
+hands through hints, the scores are what perfect play could reach, not what the players
+can be sure of reaching.
+"""
+import argparse
+import random
+import time
+
+from tabulate import tabulate
+
+import sampler
+from game_objects import *
+
+DEFAULT_BUDGET = 5.0 #seconds
+MAX_DECK = 6 #more cards left in the deck than this, and a deal can't be searched in time
+DEAD = NUM_IDENTITIES #stands for any card which can no longer be played
+ZOBRIST_BITS = 64
+
+
+class OutOfTime(Exception):
+    """
+    Raised within a search when its time budget runs out.
+    """
+
+
+def turns_left(game):
+    """
+    The number of turns the game has left if the deck is empty (every player gets one
+    more turn after the last card is drawn), or None if it is not.  The game objects
+    don't end a game when its last turn is taken, so a logged game may run on past
+    it; such a game has 0 turns left.
+    """
+    if game.num_in_deck:
+        return None
+    deck_size = len(OutstandingCards()) - GameState.HAND_SIZES[game.num_players] * game.num_players
+    drawn = 0
+    for i, action in enumerate(game.turns_taken):
+        if isinstance(action, (PlayAction, DiscardAction, MisfireAction)):
+            drawn += 1
+            if drawn == deck_size:
+                return max(0, game.num_players - (len(game.turns_taken) - i - 1))
+    return game.num_players
+
+
+class Zobrist:
+    """
+    Random keys for each feature of a position, whose exclusive or is the position's hash.
+    A hand holding k copies of an identity has the keys of copies 1, ..., k, so that
+    equal hands hash alike in whatever order they hold their cards.
+    """
+    def __init__(self, num_players, rng):
+        bits = lambda: rng.getrandbits(ZOBRIST_BITS)
+        self.cards = [[[bits() for _ in range(GameState.HAND_SIZES[num_players] + 1)]
+                       for _ in range(NUM_IDENTITIES + 1)] for _ in range(num_players)]
+        self.levels = [[bits() for _ in range(MAX_CARD_VALUE + 1)] for _ in Color]
+        self.hints = [bits() for _ in range(GameState.MAX_HINTS + 1)]
+        self.misfires = [bits() for _ in range(GameState.MAX_MISFIRES + 2)]
+        self.player_up = [bits() for _ in range(num_players)]
+        self.drawn = [bits() for _ in range(sum(OutstandingCards().counts) + 1)]
+        self.turns_left = [bits() for _ in range(num_players + 2)]
+
+    def hand(self, player, hand):
+        key = 0
+        copies = {}
+        for card in hand:
+            copies[card] = copies.get(card, 0) + 1
+            key ^= self.cards[player][card][copies[card]]
+        return key
+
+
+class Position:
+    """
+    A position in a game of perfect information: every hand (tuples of identity indices,
+    with DEAD for cards which can no longer be played, kept sorted) and the deck, of which
+    the first drawn cards are gone.  turns_left is None until the deck runs out.
+    """
+    def __init__(self, hands, deck, drawn, levels, hints, misfires, player_up, turns_left):
+        self.hands = hands
+        self.deck = deck
+        self.drawn = drawn
+        self.levels = levels
+        self.hints = hints
+        self.misfires = misfires
+        self.player_up = player_up
+        self.turns_left = turns_left
+
+    def score(self):
+        return sum(self.levels)
+
+    def over(self):
+        return self.misfires > GameState.MAX_MISFIRES \
+               or (self.turns_left is not None and self.turns_left <= 0) \
+               or self.score() == len(Color) * MAX_CARD_VALUE
+
+    def key(self, zobrist):
+        key = zobrist.hints[self.hints] ^ zobrist.misfires[self.misfires] \
+              ^ zobrist.player_up[self.player_up] ^ zobrist.drawn[self.drawn] \
+              ^ zobrist.turns_left[self.turns_left + 1 if self.turns_left is not None else 0]
+        for color, level in enumerate(self.levels):
+            key ^= zobrist.levels[color][level]
+        for player, hand in enumerate(self.hands):
+            key ^= zobrist.hand(player, hand)
+        return key
+
+    def moves(self):
+        """
+        The distinct moves open to the player up, likeliest to be good first: each
+        playable card, a hint, each discard, then the misfires.  A move is
+        ('play' | 'discard', card) or ('hint', None); a player with no cards and no
+        hints to give can only ('pass', None).
+        """
+        hand = self.hands[self.player_up]
+        playable = [card for card in set(hand)
+                    if card != DEAD and card % MAX_CARD_VALUE == self.levels[card // MAX_CARD_VALUE]]
+        moves = [('play', card) for card in sorted(playable)]
+        if self.hints > 0 and len(self.hands) > 1:
+            moves.append(('hint', None))
+        if self.hints < GameState.MAX_HINTS:
+            moves += [('discard', card) for card in sorted(set(hand))]
+        #misfiring a dead card loses nothing else, so is the only misfire worth trying
+        #if there is one; otherwise, which card is lost matters
+        unplayable = sorted(set(hand) - set(playable))
+        if DEAD in unplayable:
+            moves.append(('play', DEAD))
+        else:
+            moves += [('play', card) for card in unplayable]
+        return moves or [('pass', None)]
+
+    def after(self, move):
+        """
+        The position after a move.
+        """
+        action, card = move
+        hands = [*self.hands]
+        levels = [*self.levels]
+        hints, misfires, drawn, turns_left = self.hints, self.misfires, self.drawn, self.turns_left
+        if action == 'hint':
+            hints -= 1
+        elif action != 'pass':
+            hand = [*hands[self.player_up]]
+            hand.remove(card)
+            if action == 'discard':
+                hints += 1
+            elif card != DEAD and card % MAX_CARD_VALUE == levels[card // MAX_CARD_VALUE]:
+                levels[card // MAX_CARD_VALUE] += 1
+                if levels[card // MAX_CARD_VALUE] == MAX_CARD_VALUE and hints < GameState.MAX_HINTS:
+                    hints += 1
+            else:
+                #a misfire gives back a hint, as in Player.perform_play
+                misfires += 1
+                hints += 1 if hints < GameState.MAX_HINTS else 0
+            if drawn < len(self.deck):
+                hand.append(self.deck[drawn])
+                drawn += 1
+                if drawn == len(self.deck):
+                    turns_left = len(hands) + 1 #the decrement below counts this turn
+            hands[self.player_up] = hand
+            #cards of a color whose firework just grew may have become dead
+            hands = [tuple(sorted([c if c == DEAD or c % MAX_CARD_VALUE >= levels[c // MAX_CARD_VALUE]
+                                   else DEAD for c in h])) for h in hands]
+        if turns_left is not None:
+            turns_left -= 1
+        return Position(tuple(hands), self.deck, drawn, tuple(levels), hints, misfires,
+                        (self.player_up + 1) % len(hands), turns_left)
+
+
+class Search:
+    """
+    Exhaustive search of one deal, with a transposition table and pruning (see the
+    module docstring).  reach is, for each color, the highest card of it which could
+    still be played given the copies left in the deal.
+    """
+    CHECK_EVERY = 1024 #nodes between looks at the clock
+
+    def __init__(self, reach, zobrist, deadline):
+        self.reach = reach
+        self.zobrist = zobrist
+        self.deadline = deadline
+        self.table = {} #hash -> (score, exact); if not exact, score is an upper bound
+        self.nodes = 0
+
+    def bound(self, position):
+        """
+        The most that could still be scored from position.
+        """
+        missing = sum([max(reach - level, 0) for reach, level in zip(self.reach, position.levels)])
+        if position.turns_left is None:
+            turns = len(position.deck) - position.drawn + len(position.hands)
+        else:
+            turns = position.turns_left
+        return position.score() + min(missing, turns)
+
+    def best(self, position, alpha=-1):
+        """
+        The best score reachable from position; if that is no more than alpha, the
+        result may be any upper bound on it which is no more than alpha.
+        """
+        self.nodes += 1
+        if self.nodes % self.CHECK_EVERY == 0 and time.perf_counter() > self.deadline:
+            raise OutOfTime()
+        if position.over():
+            return position.score()
+        key = position.key(self.zobrist)
+        try:
+            score, exact = self.table[key]
+            if exact or score <= alpha:
+                return score
+        except KeyError:
+            pass
+        ceiling = self.bound(position)
+        if ceiling <= alpha:
+            return ceiling
+        best = -1
+        for move in position.moves():
+            best = max(best, self.best(position.after(move), max(alpha, best)))
+            if best == ceiling:
+                break
+        exact = best > alpha
+        self.table[key] = (best, exact)
+        return best
+
+
+def reachable(deal_cards, levels):
+    """
+    For each color, the highest card which could be played, given the levels of the
+    fireworks and the cards (identity indices) still in hands or deck.
+    """
+    present = set(deal_cards)
+    reach = []
+    for color, level in enumerate(levels):
+        while level < MAX_CARD_VALUE and color * MAX_CARD_VALUE + level in present:
+            level += 1
+        reach.append(level)
+    return reach
+
+
+class EndgameAnalysis:
+    """
+    For each of the player up's moves (('play' | 'discard', position) or ('hint', None)),
+    the weighted sum of the best scores found after it over the deals searched, and the
+    best score after it in any deal.
+    """
+    def __init__(self, moves):
+        self.moves = moves
+        self.totals = {move : 0.0 for move in moves}
+        self.best = {move : 0 for move in moves}
+        self.weight = 0.0
+        self.deals = 0
+        self.nodes = 0
+
+    def represent(self):
+        if not self.weight:
+            return 'No deal fitting the hints was searched in the time given; try more time.'
+        rows = []
+        for move in sorted(self.moves, key=lambda m: -self.totals[m]):
+            action, position = move
+            name = action if position is None else f'{action} {position + 1}'
+            rows.append([name, f'{self.totals[move] / self.weight:.2f}', self.best[move]])
+        return tabulate([['move', 'mean best score', 'best in any deal'], *rows],
+                        headers='firstrow', tablefmt='pretty')
+
+    def __str__(self):
+        return f'{self.deals} deals searched ({self.nodes} positions)'
+
+
+def analyze(game, budget=DEFAULT_BUDGET, seed=None, max_deals=None, max_deck=MAX_DECK):
+    """
+    Search deals of game (see the module docstring) for budget seconds, or until
+    max_deals have been searched; return an EndgameAnalysis of the player up's moves.
+    Raises HanabiSimException if the game is over, or has more than max_deck cards left
+    in the deck.
+    """
+    if game.over or turns_left(game) == 0:
+        raise HanabiSimException('The game is over; there are no moves to analyze.')
+    if game.num_in_deck > max_deck:
+        raise HanabiSimException(f'Too many cards are left in the deck ({game.num_in_deck}) '\
+                                 f'to search the rest of the game; at most {max_deck} may be.')
+    deadline = time.perf_counter() + budget
+    rng = random.Random(seed)
+    hand_sizes = [len(player.hand) for player in game.players]
+    masks = [card.mask for player in game.players for card in player.hand.hand]
+    dealer = sampler.Dealer(masks, [*game.outstanding_cards.counts], rng)
+    zobrist = Zobrist(game.num_players, rng)
+    levels = tuple([game.play[color].number for color in Color])
+    up = game.player_up
+    moves = [(action, p) for p in range(hand_sizes[up]) for action in ('play', 'discard')
+             if action == 'play' or game.hints < game.MAX_HINTS]
+    if game.hints > 0:
+        moves.append(('hint', None))
+    analysis = EndgameAnalysis(moves)
+    while (max_deals is None or analysis.deals < max_deals) and time.perf_counter() < deadline:
+        dealt, weight, left = dealer.deal()
+        if not weight:
+            continue
+        deck = [i for i, count in enumerate(left) for _ in range(count)]
+        rng.shuffle(deck)
+        deck = tuple(deck[:game.num_in_deck])
+        reach = reachable(dealt + [*deck], levels)
+        live = lambda c: c if c % MAX_CARD_VALUE >= levels[c // MAX_CARD_VALUE] else DEAD
+        hands, start = [], 0
+        for size in hand_sizes:
+            hands.append([live(c) for c in dealt[start:start + size]])
+            start += size
+        root = Position(tuple([tuple(sorted(hand)) for hand in hands]),
+                        tuple([live(c) for c in deck]), 0, levels, game.hints,
+                        game.misfires, up, turns_left(game))
+        search = Search(reach, zobrist, deadline)
+        scores = {}
+        try:
+            for action, p in moves:
+                #positions hold unordered cards; a move by position is a move of its card here
+                card = hands[up][p] if p is not None else None
+                scores[(action, p)] = search.best(root.after((action, card)))
+        except OutOfTime:
+            analysis.nodes += search.nodes
+            break
+        analysis.nodes += search.nodes
+        analysis.deals += 1
+        analysis.weight += weight
+        for move, score in scores.items():
+            analysis.totals[move] += weight * score
+            analysis.best[move] = max(analysis.best[move], score)
+    return analysis
+
+
+if __name__ == '__main__':
+    import replay
+
+    parser = argparse.ArgumentParser(prog='endgame',
+                                     description='Find the best score reachable after each move in a logged game',
+    )
+    parser.add_argument('infile', help='a game log, text or binary')
+    parser.add_argument('-t', '--time', type=float, default=DEFAULT_BUDGET,
+                        help='seconds to spend searching')
+    parser.add_argument('-s', '--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    result = replay.replay_file(args.infile)
+    if result.game is None:
+        print(f'{args.infile}: no game (setup incomplete)')
+        exit(1)
+    try: analysis = analyze(result.game, args.time, seed=args.seed)
+    except HanabiSimException as e:
+        print(e.args[0])
+        exit(1)
+    print(f'{result.game.players[result.game.player_up].name} to move; {analysis}')
+    print(analysis.represent())
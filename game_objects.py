@@ -1,8 +1,10 @@
 from enum import Enum
+from random import Random
 from tabulate import tabulate
 from colorama import Fore, Back, Style
-from bisect import insort
+from bisect import insort, bisect_left
 from collections import defaultdict
+from itertools import islice
 
 
 class Color(Enum):
@@ -19,6 +21,32 @@ MIN_CARD_VALUE = 1
 MAX_CARD_VALUE = 5
 CARD_FREQUENCIES = [3,2,2,2,1]
 
+#Card identities are numbered 0-24 (color-major) so that the set of identities a card
+#may still have can be kept as the bits of a single integer
+NUM_IDENTITIES = len(Color) * (MAX_CARD_VALUE - MIN_CARD_VALUE + 1)
+ALL_IDENTITIES = (1 << NUM_IDENTITIES) - 1
+
+def card_index(color, number):
+    """
+    The bit position of the identity (color, number) in an identity mask.
+    """
+    return (color.value - 1) * (MAX_CARD_VALUE - MIN_CARD_VALUE + 1) + number - MIN_CARD_VALUE
+
+def card_at_index(i):
+    """
+    The Card whose identity is at bit position i of an identity mask.
+    """
+    return CARDS_BY_INDEX[i]
+
+COLOR_MASKS = {
+    color : sum(1 << card_index(color, n) for n in range(MIN_CARD_VALUE, MAX_CARD_VALUE + 1))
+    for color in Color
+}
+NUMBER_MASKS = {
+    n : sum(1 << card_index(color, n) for color in Color)
+    for n in range(MIN_CARD_VALUE, MAX_CARD_VALUE + 1)
+}
+
 PRINT_STYLE = {
     Color.BLUE:   Fore.LIGHTBLUE_EX,
     Color.RED:    Fore.LIGHTRED_EX,
@@ -55,11 +83,31 @@ def guess_text(color, text):
 
 class Card:
     """
-    A card of known number and color.
+    A card of known number and color.  Cards are interned: there is one Card for each
+    color and number (including 0, the number of an empty pile), and Card(color, number)
+    returns it, so cards are equal only if they are the same object, and never change.
+    index is the card's bit position in an identity mask (None for a number of 0), and
+    order the integer by which cards are sorted: by color, then number.
     """
-    def __init__(self, color, number):
-        self.color = color
-        self.number = number
+    __slots__ = ('color', 'number', 'index', 'order')
+    _interned = {}
+
+    def __new__(cls, color, number):
+        try: return cls._interned[color, number]
+        except KeyError: pass
+        if not (isinstance(color, Color) and MIN_CARD_VALUE - 1 <= number <= MAX_CARD_VALUE):
+            raise HanabiSimException(f'There is no card {color} {number}.')
+        card = super().__new__(cls)
+        card.color = color
+        card.number = number
+        card.index = card_index(color, number) if number >= MIN_CARD_VALUE else None
+        card.order = (color.value - 1) * (MAX_CARD_VALUE + 1) + number
+        cls._interned[color, number] = card
+        return card
+
+    def __reduce__(self):
+        #unpickle to the interned card, not a copy of it
+        return (Card, (self.color, self.number))
 
     def __str__(self):
         return style_text(self.color, f'{self.color.name} {self.number}')
@@ -68,51 +116,56 @@ class Card:
         return style_text(self.color, f'{self.color.name} {self.number}')
 
     def __eq__(self, other):
-        if not isinstance(other, Card):
-            return False
-        return self.color == other.color and self.number == other.number
+        return self is other
+
+    def __hash__(self):
+        return self.order
 
     def __lt__(self, other):
-        if not isinstance(self, Card):
+        if not isinstance(other, Card):
             raise ValueError(f'Cannot compare Card {self} and non-card {other}.')
-        return self.color.value  * len(Color) + self.number < \
-               other.color.value * len(Color) + other.number
+        return self.order < other.order
 
     def __gt__(self, other):
-        if not isinstance(self, Card):
+        if not isinstance(other, Card):
             raise ValueError(f'Cannot compare Card {self} and non-card {other}.')
-        return self.color.value  * len(Color) + self.number > \
-               other.color.value * len(Color) + other.number
+        return self.order > other.order
 
     def __le__(self, other):
-        if not isinstance(self, Card):
+        if not isinstance(other, Card):
             raise ValueError(f'Cannot compare Card {self} and non-card {other}.')
-        return self.color.value  * len(Color) + self.number <= \
-               other.color.value * len(Color) + other.number
+        return self.order <= other.order
 
     def __ge__(self, other):
-        if not isinstance(self, Card):
+        if not isinstance(other, Card):
             raise ValueError(f'Cannot compare Card {self} and non-card {other}.')
-        return self.color.value  * len(Color) + self.number >= \
-               other.color.value * len(Color) + other.number
+        return self.order >= other.order
 
     def copy(self):
         return self
 
 
+#the interned cards of each identity, by bit position in an identity mask
+CARDS_BY_INDEX = [Card(Color(i // (MAX_CARD_VALUE - MIN_CARD_VALUE + 1) + 1),
+                       i % (MAX_CARD_VALUE - MIN_CARD_VALUE + 1) + MIN_CARD_VALUE)
+                  for i in range(NUM_IDENTITIES)]
+
+
 class UnknownCard:
     """
     A card whose identity is not certain; it may be restricted by hints which exclude
     certain colors or numbers from the card's possible identities.
     """
+    __slots__ = ('mask', 'round_drawn', 'color_guess', 'number_guess', 'round_updated', 'turn_updated',
+                 'parent')
+
     def __init__(self, round_drawn, turn_drawn):
-        self.colors = {color for color in (Color)}
-        self.numbers = {*range(MIN_CARD_VALUE, MAX_CARD_VALUE + 1)}
+        self.mask = ALL_IDENTITIES #bit card_index(color, number) set <=> identity still possible
         self.round_drawn = round_drawn
         self.color_guess = None
         self.number_guess = None
         self.round_updated, self.turn_updated = (round_drawn, turn_drawn)
-        self.previous_states = []
+        self.parent = None #the state this one was derived from; None for a fresh draw
 
     def hint_color_positive(self, color, rnd, trn):
         """
@@ -120,14 +173,15 @@ class UnknownCard:
         for example, a hint which tells this card is blue.
         In this example, the proper response is to remove all possible colors except blue.
         """
-        if (color not in self.colors):
+        if not self.mask & COLOR_MASKS[color]:
             raise HanabiSimException(f'Inconsistent hints: color {style_text(color, color.name)}'\
                                      f' was previously ruled out for a hinted card.\nThe card:\n'\
                                      f'{str(self)}')
-        if self.colors == {color}: return self #nothing to do
+        new_mask = self.mask & COLOR_MASKS[color]
+        if new_mask == self.mask: return self #nothing to do
         new_state = self.copy()
-        new_state.colors = {color}
-        new_state.previous_states.append(self)
+        new_state.mask = new_mask
+        new_state.parent = self
         new_state.round_updated, new_state.turn_updated = (rnd, trn)
         return new_state
 
@@ -137,14 +191,14 @@ class UnknownCard:
         for example, a hint which tells another card card is red.
         In this case, the proper response is to update the card to disallow being red.
         """
-        if (color not in self.colors): return self #nothing to do
+        if not self.mask & COLOR_MASKS[color]: return self #nothing to do
         new_state = self.copy()
-        new_state.colors.discard(color)
-        if len(new_state.colors) == 0:
+        new_state.mask &= ~COLOR_MASKS[color]
+        if not new_state.mask:
             raise HanabiSimException(f'Inconsistent hints; color {style_text(color, color.name)}'\
                                      f' was the only possible color for a non-hinted card.\n'\
                                      f'The card:\n{str(self)}') 
-        new_state.previous_states.append(self)
+        new_state.parent = self
         new_state.round_updated, new_state.turn_updated = (rnd, trn)
         return new_state
 
@@ -154,14 +208,15 @@ class UnknownCard:
         for example, a hint which tells this card has value 3.
         In this example, the proper response is to update the card to remove all possible values except 3.
         """
-        if (number not in self.numbers):
+        if not self.mask & NUMBER_MASKS[number]:
             raise HanabiSimException(f'Inconsistent hints; number {number} was '\
                                      f'previously ruled out for a hinted card.\n'\
                                      f'The card:\n{str(self)}')
-        if self.numbers == {number}: return self #nothing to do
+        new_mask = self.mask & NUMBER_MASKS[number]
+        if new_mask == self.mask: return self #nothing to do
         new_state = self.copy()
-        new_state.numbers = {number}
-        new_state.previous_states.append(self)
+        new_state.mask = new_mask
+        new_state.parent = self
         new_state.round_updated, new_state.turn_updated = (rnd, trn)
         return new_state
 
@@ -171,14 +226,14 @@ class UnknownCard:
         for example, a hint which tells another card has value 2.
         In this example, the proper response is to update the card to disallow having value 3.
         """
-        if (number not in self.numbers): return self #nothing to do
+        if not self.mask & NUMBER_MASKS[number]: return self #nothing to do
         new_state = self.copy()
-        new_state.numbers.discard(number)
-        if len(new_state.numbers) == 0:
+        new_state.mask &= ~NUMBER_MASKS[number]
+        if not new_state.mask:
             raise HanabiSimException(f'Inconsistent hints; number {number} was the '\
                                      f'only possible number for a non-hinted card.\n'\
                                      f'The card:\n{str(self)}')
-        new_state.previous_states.append(self)
+        new_state.parent = self
         new_state.round_updated, new_state.turn_updated = (rnd, trn)
         return new_state
 
@@ -188,26 +243,26 @@ class UnknownCard:
         """
         Apply a player's guess of number to a card; example, the player guesses a card has value 1.
         """
-        if (number not in self.numbers):
+        if not self.mask & NUMBER_MASKS[number]:
             raise HanabiSimException(f'Bad guess; number {number} was previously '\
                                      f'ruled out for guessed card.')
         if number == self.number_guess: return self #nothing to do
         new_state = self.copy()
         new_state.number_guess = number
-        new_state.previous_states.append(self)
+        new_state.parent = self
         return new_state
 
     def guess_color(self, color):
         """
         Apply a player's guess of color to a card; example, the player guesses a card is green.
         """
-        if (color not in self.colors):
+        if not self.mask & COLOR_MASKS[color]:
             raise HanabiSimException(f'Bad guess; color {style_text(color, color.name)} '\
                                      f'was previously ruled out for guessed card.')
         if color == self.color_guess: return self #nothing to do
         new_state = self.copy()
         new_state.color_guess = color
-        new_state.previous_states.append(self)
+        new_state.parent = self
         return new_state
 
     def __str__(self):
@@ -215,13 +270,11 @@ class UnknownCard:
         #use a special style for the guess, if any
         #Note we iterate on enum Color (not self.colors) to guarantee the same order
         colorstr = ''.join([
-            '' if color not in self.colors else
+            '' if not self.mask & COLOR_MASKS[color] else
             guess_text(color, color.name[0]) if color == self.color_guess else
             style_text(color, color.name[0]) for color in Color
         ])
         #display all possible numbers; display the guess (if any) in a special style
-        #Note we iterate on self.numbers which gives us the same order always
-        #TODO self.numbers is a set; is the consistent ordering just a coincidence or guaranteed?
         numberstr = ''.join([
             guess_text(number, str(number)) if number == self.number_guess
             else str(number) for number in self.numbers
@@ -234,45 +287,76 @@ class UnknownCard:
                         tablefmt='pretty')
         return rep
 
+    def past_states(self):
+        """
+        Walk back through the states this card has held, most recent first,
+        not including the current state.
+        """
+        state = self.parent
+        while state is not None:
+            yield state
+            state = state.parent
+
     def show_past_states(self):
         fake_hand = Hand(0) #a bit of a hack, but we basically want the same representation
-        fake_hand.hand = [*self.previous_states, self]
+        fake_hand.hand = [*reversed([*self.past_states()]), self]
         return str(fake_hand)
 
     def copy(self):
         cpy = UnknownCard(self.round_drawn, self.turn_updated)
-        cpy.colors = self.colors.copy()
-        cpy.numbers = self.numbers.copy()
+        cpy.mask = self.mask
         cpy.color_guess = self.color_guess
         cpy.number_guess = self.number_guess
         cpy.round_updated = self.round_updated 
         cpy.turn_updated = self.turn_updated
-        cpy.previous_states = [c for c in self.previous_states]
+        cpy.parent = self.parent #history is shared, never modified
         return cpy
 
+    @property
+    def colors(self):
+        """
+        The colors this card may still have, in Color order.
+        """
+        return [color for color in Color if self.mask & COLOR_MASKS[color]]
+
+    @property
+    def numbers(self):
+        """
+        The numbers this card may still have, in ascending order.
+        """
+        return [n for n in range(MIN_CARD_VALUE, MAX_CARD_VALUE + 1) if self.mask & NUMBER_MASKS[n]]
+
+    def may_be(self, card):
+        """
+        Whether the known card given is consistent with the hints this card has received.
+        """
+        return bool(self.mask >> card.index & 1)
+
     def num_possible_states(self):
         """
         A basic representation of the undertainty in a card, not accounting for
         any advanced information like discards which might rule out some states
         """
-        return len(self.numbers) * len(self.colors)
+        return self.mask.bit_count()
 
     def __eq__(self, other):
+        #the card as it stands; past states are not compared (see past_states for them)
+        if self is other: return True
         if not isinstance(other, UnknownCard): return False
-        return self.colors == other.colors               and \
-               self.numbers == other.numbers             and \
+        return self.mask == other.mask                   and \
                self.color_guess == other.color_guess     and \
                self.number_guess == other.number_guess   and \
                self.round_drawn == other.round_drawn     and \
                self.round_updated == other.round_updated and \
-               self.turn_updated == other.turn_updated   and \
-               self.previous_states == other.previous_states
+               self.turn_updated == other.turn_updated
 
 
 class RealizedCard:
     """
     A card of known value or number because it was played or discarded.
     """
+    __slots__ = ('identity', 'unrealized_state')
+
     def __init__(self, identity, unrealized_state):
         self.identity = identity #Card object
         self.unrealized_state = unrealized_state #UnknownCard object
@@ -287,6 +371,8 @@ class Hand:
     """
     A collection of the cards in the hand of a player
     """
+    __slots__ = ('hand',)
+
     def __init__(self, HAND_SIZE):
         self.hand = [UnknownCard(0, '-') for _ in range(HAND_SIZE)]
 
@@ -298,32 +384,29 @@ class Hand:
         given in the hint need to be updated negatively
         (removing the possibility of having the value or color given in the hint).
         """
+        if isinstance(hint, Color):
+            positive, negative = UnknownCard.hint_color_positive, UnknownCard.hint_color_negative
+        else:
+            positive, negative = UnknownCard.hint_number_positive, UnknownCard.hint_number_negative
         new_hand = self.copy()
         for i, card in enumerate(self.hand):
-            if isinstance(hint, Color):
-                try: 
-                    new_hand.hand[i] = card.hint_color_positive(hint, r, t) if i in positions \
-                                       else card.hint_color_negative(hint, r, t)
-                except HanabiSimException as e:
-                    raise HanabiIndexException(i, *e.args)
-            else:
-                try:
-                    new_hand.hand[i] = card.hint_number_positive(hint, r, t) if i in positions \
-                                  else card.hint_number_negative(hint, r, t)
-                except HanabiSimException as e:
-                    raise HanabiIndexException(i, *e.args)
+            try:
+                new_hand.hand[i] = positive(card, hint, r, t) if i in positions \
+                                   else negative(card, hint, r, t)
+            except HanabiSimException as e:
+                raise HanabiIndexException(i, *e.args)
         return new_hand
 
     def process_guess(self, position, guess):
         try: card = self.hand[position]
         except IndexError: raise HanabiIndexException(position)
         if isinstance(guess, int):
-            if guess not in card.numbers:
-                raise HanabiSimException(f'Bad guess; number {number} already disqualified.')
+            if not card.mask & NUMBER_MASKS[guess]:
+                raise HanabiSimException(f'Bad guess; number {guess} already disqualified.')
             new_card_state = card.guess_number(guess)
         elif isinstance(guess, Color):
-            if guess not in card.colors:
-                raise HanabiSimException(f'Bad guess; color {style_text(color, color.name)} '
+            if not card.mask & COLOR_MASKS[guess]:
+                raise HanabiSimException(f'Bad guess; color {style_text(guess, guess.name)} '
                                          f'already disqualified.')
             new_card_state = card.guess_color(guess)
         new_hand = self.copy()
@@ -360,16 +443,20 @@ class Hand:
                 raise HanabiSimException('Illegal replenishment protocol')
         return new_hand
 
-    def num_possible_states(self):
-        accumulator = 1
-        for card in self.hand:
-            accumulator *= card.num_possible_states()
-        return accumulator
+    def num_possible_states(self, outstanding_cards):
+        """
+        The number of different assignments of identities to the cards in the hand which
+        are consistent with the hints given and don't use more copies of any card than
+        are outstanding (pass the game's outstanding_cards).
+        """
+        from inference import cached_count #inference builds on this module
+        return cached_count([card.mask for card in self.hand], outstanding_cards.counts, weighted=False)
 
     def __len__(self):
         return len(self.hand)
 
     def __eq__(self, other):
+        if self is other: return True
         if not isinstance(other, Hand): return False
         return self.hand == other.hand
 
@@ -379,7 +466,7 @@ class Hand:
     def __str__(self):
         colorstrs = [
             ''.join([
-                '' if color not in card.colors else
+                '' if not card.mask & COLOR_MASKS[color] else
                 guess_text(color, color.name[0]) if color == card.color_guess else
                 style_text(color, color.name[0]) for color in Color
             ]) for card in self.hand
@@ -404,7 +491,7 @@ class Hand:
         return rep
 
     def copy(self):
-        cpy = Hand(len(self.hand))
+        cpy = Hand(0)
         cpy.hand = [card for card in self.hand] #UnknownCard immutable; shallow copy safe 
         return cpy
 
@@ -413,6 +500,8 @@ class PlayedCards:
     """
     A collection of cards which have been played successfully, adding to a firework.
     """
+    __slots__ = ('cards',)
+
     def __init__(self):
         self.cards = {color : Card(color, 0) for color in (Color)}
 
@@ -423,6 +512,16 @@ class PlayedCards:
         new_state.cards[color] = card
         return new_state
 
+    def remove(self, card):
+        """
+        The piles as they were before card was added to them.
+        """
+        if self.cards[card.color] != card:
+            raise HanabiSimException(f'{card} is not the top of its firework.')
+        new_state = self.copy()
+        new_state.cards[card.color] = Card(card.color, card.number - 1)
+        return new_state
+
     def values(self):
         return self.cards.values()
 
@@ -446,26 +545,48 @@ class OutstandingCards:
     by discards and plays.  Notably, cards which are in players' hands are
     considered to be outstanding because they are not publicly known.
     """
-    def __init__(self):
-        self.cards = []
+    __slots__ = ('counts', 'total')
 
-        for color in (Color):
-            for i in range(MIN_CARD_VALUE, MAX_CARD_VALUE + 1):
-                for j in range(CARD_FREQUENCIES[i - 1]):
-                   self.cards.append(Card(color, i))
+    def __init__(self):
+        #counts[card_index(color, number)] is the number of copies of that card outstanding
+        self.counts = [CARD_FREQUENCIES[n - MIN_CARD_VALUE] for color in Color
+                       for n in range(MIN_CARD_VALUE, MAX_CARD_VALUE + 1)]
+        self.total = sum(self.counts)
 
     def remove(self, card):
+        if not self.counts[card.index]:
+            raise ValueError(f'No copies of {card} are outstanding.')
         copy = self.copy()
-        copy.cards.remove(card)
+        copy.counts[card.index] -= 1
+        copy.total -= 1
         return copy
 
+    def add(self, card):
+        """
+        The outstanding cards with a copy of card put back; the reverse of remove.
+        """
+        copy = self.copy()
+        copy.counts[card.index] += 1
+        copy.total += 1
+        return copy
+
+    def count(self, card):
+        """
+        The number of copies of the given card which are still outstanding.
+        """
+        return self.counts[card.index]
+
     def __len__(self):
-        return len(self.cards)
+        return self.total
 
     def __str__(self):
         data = [[style_text(color, color.name) for color in Color]]
         #Sort outstanding cards by color
-        columns = [ [*filter(lambda card: card.color == color, self.cards)] for color in Color ]
+        columns = [
+            [Card(color, n) for n in range(MIN_CARD_VALUE, MAX_CARD_VALUE + 1)
+                            for _ in range(self.counts[card_index(color, n)])]
+            for color in Color
+        ]
         table_length = max([len(col) for col in columns])
         #Create table rows.  Each row is the next card number of that color, or empty if no
         #cards of that color remain.
@@ -476,8 +597,8 @@ class OutstandingCards:
     
     def copy(self):
         cpy = OutstandingCards()
-        #cards immutable; no deep copy needed
-        cpy.cards = self.cards.copy()
+        cpy.counts = self.counts.copy()
+        cpy.total = self.total
         return cpy
 
 
@@ -485,12 +606,25 @@ class DiscardedCards:
     """
     A collection of all cards which have been discarded.
     """
+    __slots__ = ('cards',)
+
     def __init__(self):
         self.cards = {color : [] for color in (Color)}
 
     def add(self, card):
-        new_state = self.copy()
-        insort(new_state.cards[card.color], card, key = lambda c: c.number)
+        #only the pile of the discarded color changes; the other piles are shared
+        new_state = DiscardedCards()
+        new_state.cards = {**self.cards, card.color : self.cards[card.color].copy()}
+        insort(new_state.cards[card.color], card) #by Card.order; within a color, by number
+        return new_state
+
+    def remove(self, card):
+        """
+        The discards with one copy of card taken back out; the reverse of add.
+        """
+        new_state = DiscardedCards()
+        new_state.cards = {**self.cards, card.color : self.cards[card.color].copy()}
+        new_state.cards[card.color].remove(card)
         return new_state
 
     def copy(self):
@@ -513,40 +647,156 @@ class DiscardedCards:
 
 
 class HintAction:
+    """
+    A hint, as the indices of the players giving and receiving it, the hint (a Color or
+    number), and a mask of the positions hinted (bit p for position p).  The hands before
+    and after the hint are not kept; given the game as it stood when the hint was given,
+    hands rebuilds them.
+    """
+    __slots__ = ('player_index', 'targetplayer_index', 'hint', 'positions_mask')
 
-    def __init__(self, targetplayer_index, hint, positions, before_hand, after_hand):
+    def __init__(self, player_index, targetplayer_index, hint, positions):
+        self.player_index = player_index
         self.targetplayer_index = targetplayer_index
         self.hint = hint
-        self.positions = positions
-        self.before_hand = before_hand
-        self.after_hand = after_hand
+        self.positions_mask = sum([1 << p for p in positions])
 
+    @property
+    def positions(self):
+        return [p for p in range(self.positions_mask.bit_length()) if self.positions_mask >> p & 1]
 
-class DiscardAction:
+    def hands(self, before):
+        """
+        The hinted player's hand before and after the hint, given the game before it.
+        """
+        hand = before.players[self.targetplayer_index].hand
+        return hand, hand.process_hint(self.positions, self.hint, before.round,
+                                       before.players[self.player_index].name)
 
-    def __init__(self, card, card_state_on_discard):
-        self.card = card
-        self.card_state_on_discard = card_state_on_discard
 
+class CardAction:
+    """
+    A card leaving a hand, as the indices of the player and position it left from and
+    the index (see card_index) of its identity.  The card's state in the hand is not
+    kept; given the game as it stood when the card left, card_state looks it up.
+    """
+    __slots__ = ('player_index', 'position', 'identity')
 
-class PlayAction:
+    def __init__(self, player_index, position, card):
+        self.player_index = player_index
+        self.position = position
+        self.identity = card.index
 
-    def __init__(self, card, card_state_on_discard):
-        self.card = card
-        self.card_state_on_discard = card_state_on_discard
+    @property
+    def card(self):
+        return card_at_index(self.identity)
 
+    def card_state(self, before):
+        """
+        The card's state (an UnknownCard) in its hand, given the game before it left.
+        """
+        return before.players[self.player_index].hand[self.position]
 
-class MisfireAction:
 
-    def __init__(self, card, card_state_on_discard):
-        self.card = card
-        self.card_state_on_discard = card_state_on_discard
+class DiscardAction(CardAction):
+    __slots__ = ()
+
+
+class PlayAction(CardAction):
+    __slots__ = ()
+
+
+class MisfireAction(CardAction):
+    __slots__ = ()
+
+
+class ActionLog:
+    """
+    The actions taken in a game so far, in turn order, indexed by type of action.
+    Versions of a log share one underlying list, of which each version sees only
+    its own prefix; adding an action returns a new version and leaves this one,
+    and any states which hold it (such as those reachable by undo), unchanged.
+    """
+    __slots__ = ('actions', 'length', 'positions')
+
+    def __init__(self):
+        self.actions = []
+        self.length = 0
+        #positions[typ] lists the indices in actions of each action of type typ; it is
+        #shared between versions like actions, and we see those below our length
+        self.positions = {}
+
+    def count(self, typ):
+        """
+        The number of actions of the given type in this version of the log.
+        """
+        return bisect_left(self.positions.get(typ, ()), self.length)
+
+    def add(self, action):
+        typ = type(action)
+        new_log = ActionLog()
+        if self.length == len(self.actions):
+            #nothing follows our prefix yet; extend the shared lists in place
+            new_log.actions, new_log.positions = self.actions, self.positions
+        else:
+            #another version already extended the shared lists (e.g. we were undone to);
+            #branch off with lists of our own
+            new_log.actions = self.actions[:self.length]
+            new_log.positions = {t : p[:self.count(t)] for t, p in self.positions.items()}
+        new_log.actions.append(action)
+        new_log.positions.setdefault(typ, []).append(self.length)
+        new_log.length = self.length + 1
+        return new_log
+
+    def prefix(self, length):
+        """
+        The version of this log which had taken only the first length actions.
+        """
+        if not 0 <= length <= self.length:
+            raise ValueError(f'No version of the log has {length} actions; this one has {self.length}.')
+        if length == self.length: return self
+        log = ActionLog.__new__(ActionLog) #bypass __init__, which would make lists of our own
+        log.actions, log.positions, log.length = self.actions, self.positions, length
+        return log
+
+    def of_type(self, typ):
+        """
+        Yield (index, action) for each action of the given type, in turn order.
+        """
+        for i in islice(self.positions.get(typ, ()), self.count(typ)):
+            yield i, self.actions[i]
+
+    def of_player(self, player_index, num_players):
+        """
+        The actions taken by the player at player_index, in turn order.
+        """
+        return self[player_index::num_players]
+
+    def of_round(self, round_index, num_players):
+        """
+        The actions taken in a round (counting from 0), in turn order.
+        """
+        return self[round_index * num_players:(round_index + 1) * num_players]
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return islice(self.actions, self.length)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.actions[i] for i in range(self.length)[item]]
+        return self.actions[range(self.length)[item]]
 
 
 class GameState:
     """
     A representation of the current public information available in a game of Hanabi
     """
+    __slots__ = ('misfires', 'hints', 'play', 'discard', 'player_up', 'round', 'num_players', 'players',
+                 'outstanding_cards', 'num_in_deck', 'over', 'turns_taken', '_zobrist')
+
     STARTING_MISFIRES, MAX_MISFIRES = 0, 2 #2 misfires => OK; 3 misfires => lose
     STARTING_HINTS, MAX_HINTS = 8, 8
     STARTING_DISCARD = {color : [] for color in (Color)}
@@ -577,8 +827,8 @@ class GameState:
         self.outstanding_cards = OutstandingCards()
         self.num_in_deck = len(self.outstanding_cards) - sum([len(p.hand) for p in self.players])
         self.over = False
-        self.previous_state = None
-        self.turns_taken = []
+        self.turns_taken = ActionLog()
+        self._zobrist = self._zobrist_from_scratch() #see zobrist
 
     def represent_play(self):
         return str(self.play)
@@ -596,13 +846,36 @@ class GameState:
                tablefmt='pretty'
         )
 
+    def score(self):
+        """
+        The number of cards successfully played so far.
+        """
+        return sum([card.number for card in self.play.values()])
+
+    def hand_weights(self, player_index, exact=False):
+        """
+        Given a player (specified by index), return the identity weights of each card in
+        their hand (see inference.py), from a cache of recent results where possible.
+        """
+        from inference import cached_weights #inference builds on this module
+        if not 0 <= player_index < self.num_players:
+            raise HanabiIndexException(player_index, 'Unreasonable player specified.')
+        return cached_weights(self.players[player_index].hand, self.outstanding_cards.counts,
+                              exact=exact)
+
     def get_player_actions(self, player_index):
         """
         Given a player (specified by index), return all actions of this player.
         """
         if not 0 <= player_index < self.num_players:
             raise HanabiIndexException(player_index, 'Unreasonable player specified.')
-        return self.turns_taken[player_index::self.num_players]
+        return self.turns_taken.of_player(player_index, self.num_players)
+
+    def get_round_actions(self, rnd):
+        """
+        Given a round (numbered as self.round is), return all actions taken in it.
+        """
+        return self.turns_taken.of_round(rnd - self.STARTING_ROUND, self.num_players)
 
     def get_actions_of_type(self, typ):
         """
@@ -617,14 +890,18 @@ class GameState:
              i %  self.num_players, #player turn
              action
             )
-            for i, action in enumerate(self.turns_taken) if isinstance(action, typ)
+            for i, action in self.turns_taken.of_type(typ)
         ]
 
     def copy(self):
-        players_copy = [p.copy() for p in self.players]
-        cpy = GameState([None] * self.num_players, [None] * self.num_players)
-        for p in players_copy:
-            p.game = cpy
+        """
+        A new version of this state for an action to modify.  Hands, piles and outstanding
+        cards are immutable and shared with this version; only the Player objects, which
+        refer back to their game, are new, and they share their hands with ours.
+        """
+        #bypass __init__, which would deal fresh hands and build a fresh deck
+        cpy = GameState.__new__(GameState)
+        players_copy = [p.copy(cpy) for p in self.players]
         cpy.misfires = self.misfires
         cpy.hints = self.hints
         cpy.play = self.play
@@ -636,10 +913,89 @@ class GameState:
         cpy.outstanding_cards = self.outstanding_cards # OutstandingCards immutable
         cpy.num_in_deck = self.num_in_deck
         cpy.over = self.over
-        cpy.previous_state = self.previous_state
-        cpy.turns_taken = self.turns_taken.copy()
+        cpy.turns_taken = self.turns_taken #ActionLog immutable
+        cpy._zobrist = self._zobrist #until the copy is changed; see rehash
         return cpy
 
+    def zobrist(self):
+        """
+        A 64-bit hash of the public state: every card's identity mask (by player and
+        position), the fireworks, the outstanding cards (and so the discards), hints,
+        misfires and player up.  It is the exclusive or of a random key for each of
+        these features, so a version of the game copied from another is hashed from the
+        other's hash, exchanging keys only for what changed (see rehash); hands and piles
+        are shared between versions until changed, so finding what changed costs next to
+        nothing.
+        """
+        return self._zobrist
+
+    def rehash(self, basis=None):
+        """
+        Bring the hash up to date after changing this version: from the hash of basis,
+        the version it was copied from, if given, or else from scratch.  Whatever changes
+        a copy calls this once it is done.
+        """
+        self._zobrist = self._zobrist_from(basis) if basis is not None else self._zobrist_from_scratch()
+
+    def _zobrist_from_scratch(self):
+        key = ZOBRIST_HINTS[self.hints] ^ ZOBRIST_MISFIRES[self.misfires] ^ ZOBRIST_PLAYER_UP[self.player_up]
+        for color, card in self.play.cards.items():
+            key ^= ZOBRIST_PLAY[color][card.number]
+        for i, count in enumerate(self.outstanding_cards.counts):
+            key ^= ZOBRIST_OUTSTANDING[i][count]
+        for p, player in enumerate(self.players):
+            for position, card in enumerate(player.hand.hand):
+                key ^= zobrist_mask(p, position, card.mask)
+        return key
+
+    def _zobrist_from(self, basis):
+        key = basis._zobrist
+        if self.hints != basis.hints:
+            key ^= ZOBRIST_HINTS[self.hints] ^ ZOBRIST_HINTS[basis.hints]
+        if self.misfires != basis.misfires:
+            key ^= ZOBRIST_MISFIRES[self.misfires] ^ ZOBRIST_MISFIRES[basis.misfires]
+        if self.player_up != basis.player_up:
+            key ^= ZOBRIST_PLAYER_UP[self.player_up] ^ ZOBRIST_PLAYER_UP[basis.player_up]
+        if self.play is not basis.play:
+            for color, card in self.play.cards.items():
+                if card.number != basis.play[color].number:
+                    key ^= ZOBRIST_PLAY[color][card.number] ^ ZOBRIST_PLAY[color][basis.play[color].number]
+        if self.outstanding_cards is not basis.outstanding_cards:
+            for i, (new, old) in enumerate(zip(self.outstanding_cards.counts,
+                                               basis.outstanding_cards.counts)):
+                if new != old:
+                    key ^= ZOBRIST_OUTSTANDING[i][new] ^ ZOBRIST_OUTSTANDING[i][old]
+        for p, (player, old_player) in enumerate(zip(self.players, basis.players)):
+            if player.hand is old_player.hand: continue
+            new, old = player.hand.hand, old_player.hand.hand
+            for position in range(max(len(new), len(old))):
+                #a missing card contributes no keys, like an empty mask
+                changed = (new[position].mask if position < len(new) else 0) \
+                          ^ (old[position].mask if position < len(old) else 0)
+                if changed:
+                    key ^= zobrist_mask(p, position, changed)
+        return key
+
+    def __hash__(self):
+        return self.zobrist()
+
+    def __eq__(self, other):
+        """
+        Whether two versions of a game have the same public state (everything zobrist
+        covers); how they came about, and guesses, are not compared.
+        """
+        if self is other: return True
+        if not isinstance(other, GameState): return False
+        if self.zobrist() != other.zobrist(): return False
+        return self.hints == other.hints and self.misfires == other.misfires \
+               and self.player_up == other.player_up \
+               and [c.number for c in self.play.values()] == [c.number for c in other.play.values()] \
+               and self.outstanding_cards.counts == other.outstanding_cards.counts \
+               and all([player.hand is other_player.hand or
+                        [card.mask for card in player.hand.hand] ==
+                        [card.mask for card in other_player.hand.hand]
+                        for player, other_player in zip(self.players, other.players)])
+
     def __str__(self):
         play = self.represent_play()
         discard = self.represent_discard()
@@ -671,10 +1027,38 @@ class GameState:
         self.player_up = self.player_up % self.num_players
 
 
+#Random keys for GameState.zobrist, fixed so that hashes agree between runs and processes
+_zobrist_rng = Random(0x4a4e4142)
+_zobrist_key = lambda: _zobrist_rng.getrandbits(64)
+ZOBRIST_CARDS = [[[_zobrist_key() for _ in range(NUM_IDENTITIES)]
+                  for _ in range(max(GameState.HAND_SIZES.values()))]
+                 for _ in range(GameState.MAX_PLAYERS)]
+ZOBRIST_PLAY = {color : [_zobrist_key() for _ in range(MAX_CARD_VALUE + 1)] for color in Color}
+ZOBRIST_OUTSTANDING = [[_zobrist_key() for _ in range(max(CARD_FREQUENCIES) + 1)]
+                       for _ in range(NUM_IDENTITIES)]
+ZOBRIST_HINTS = [_zobrist_key() for _ in range(GameState.MAX_HINTS + 1)]
+ZOBRIST_MISFIRES = [_zobrist_key() for _ in range(GameState.MAX_MISFIRES + 2)]
+ZOBRIST_PLAYER_UP = [_zobrist_key() for _ in range(GameState.MAX_PLAYERS)]
+
+def zobrist_mask(player, position, mask):
+    """
+    The exclusive or of the keys for the identities in mask, for the card at the given
+    position of the given player's hand.
+    """
+    keys = ZOBRIST_CARDS[player][position]
+    key = 0
+    while mask:
+        key ^= keys[(mask & -mask).bit_length() - 1]
+        mask &= mask - 1
+    return key
+
+
 class Player:
     """
     A player in the game of Hanabi, who holds a hand and performs actions to advance the game.
     """
+    __slots__ = ('name', 'hand', 'replenishment_protocol', 'game')
+
     def __init__(self, name, hand_size, game, replenishment_protocol='in_place'):
         self.name = name
         self.hand = Hand(hand_size)
@@ -692,8 +1076,7 @@ class Player:
             errstr = 'the position given was not in range.\n'\
                      f'Expected an integer between 1 and {len(self.hand)}, inclusive.'
             raise HanabiIndexException(position, errstr)
-        if card.color  not in self.hand[position].colors or\
-           card.number not in self.hand[position].numbers:
+        if not self.hand[position].may_be(card):
             errstr = f'The card identity {card} which you gave was not possible '\
                      f'given prior hints.\nThe card:\n{str(self.hand[position])}'
             raise HanabiIndexException(position, errstr)
@@ -701,12 +1084,12 @@ class Player:
         new_state.hints += 1
         #Put the card in the discard pile for its color; keep the pile sorted numerically
         new_state.discard = new_state.discard.add(card)
-        new_state.turns_taken.append(DiscardAction(card, self.hand[position]))
         try: new_state.outstanding_cards = new_state.outstanding_cards.remove(card)
         except ValueError:
             errstr = f'The card you specified, {card}, is exhausted '\
                      f'by prior plays and discards. (see "show outstanding")'
             raise HanabiSimException(errstr)
+        new_state.turns_taken = new_state.turns_taken.add(DiscardAction(self.game.player_up, position, card))
         #Replenishment
         player = new_state.get_player(self.game.player_up)
         if (new_state.num_in_deck > 0):
@@ -716,8 +1099,8 @@ class Player:
         else:
             player.hand = player.hand.copy()
             del player.hand.hand[position]
-        new_state.previous_state = self.game
         new_state.advance_turn()
+        new_state.rehash(self.game)
         if verbose: print(str(player))
         return new_state
 
@@ -730,15 +1113,20 @@ class Player:
             errstr = 'the position you specified was not in range.\n'\
                      f'Expected an integer between 1 and {len(self.hand)}, inclusive.'
             raise HanabiIndexException(position, errstr)
-        if card.color not in self.hand[position].colors or \
-           card.number not in self.hand[position].numbers:
+        if not self.hand[position].may_be(card):
             errstr = f'The card identity {card} which you gave was not possible '\
                      f'given prior hints.\nThe card:\n{str(self.hand[position])}'
             raise HanabiIndexException(position, errstr)
         new_state = self.game.copy()
+        #update outstanding first, so that an exhausted card is rejected before anything is logged
+        try: new_state.outstanding_cards = new_state.outstanding_cards.remove(card)
+        except ValueError:
+            errstr = f'The card you specified, {card}, is exhausted '\
+                     f'by prior plays and discards. (see "show outstanding")' 
+            raise HanabiSimException(errstr)
         #successful play
         if (card.number == new_state.play[card.color].number + 1):
-            new_state.turns_taken.append(PlayAction(card, self.hand[position]))
+            new_state.turns_taken = new_state.turns_taken.add(PlayAction(self.game.players.index(self), position, card))
             new_state.play = new_state.play.add(card)
             if card.number == MAX_CARD_VALUE:
                 new_state.hints += 1 if new_state.hints < new_state.MAX_HINTS else 0
@@ -746,17 +1134,12 @@ class Player:
                     new_state.over = True
         #unsuccessful play
         else:
-            new_state.turns_taken.append(MisfireAction(card, self.hand[position]))
+            new_state.turns_taken = new_state.turns_taken.add(MisfireAction(self.game.players.index(self), position, card))
             new_state.misfires += 1
             new_state.over = new_state.misfires > new_state.MAX_MISFIRES
             new_state.hints += 1 if new_state.hints < new_state.MAX_HINTS else 0
             new_state.discard = new_state.discard.add(card)
-        #update outstanding and replenish in any event
-        try: new_state.outstanding_cards = new_state.outstanding_cards.remove(card)
-        except ValueError:
-            errstr = f'The card you specified, {card}, is exhausted '\
-                     f'by prior plays and discards. (see "show outstanding")' 
-            raise HanabiSimException(errstr)
+        #replenish in any event
         player = new_state.get_player(self.game.players.index(self)) #get player in new state
         if (new_state.num_in_deck > 0):
             new_state.num_in_deck -= 1
@@ -764,8 +1147,8 @@ class Player:
         else:
             player.hand = player.hand.copy()
             del player.hand.hand[position]
-        new_state.previous_state = self.game
         new_state.advance_turn()
+        new_state.rehash(self.game)
         if verbose: print(str(player))
         return new_state
 
@@ -790,16 +1173,16 @@ class Player:
 
         new_state = self.game.copy()
         new_state.hints -= 1
-        new_state.previous_state = self.game
         player = new_state.get_player(self.game.players.index(target_player))
         try: 
             player.hand = player.hand.process_hint(positions, hint, new_state.round, self.name)
         except HanabiIndexException as e:
             raise e
         new_state.advance_turn()
-        hint = HintAction(self.game.players.index(target_player), hint,\
-                          positions, target_player.hand, player.hand)
-        new_state.turns_taken.append(hint)
+        hint = HintAction(self.game.players.index(self), self.game.players.index(target_player),
+                          hint, positions)
+        new_state.turns_taken = new_state.turns_taken.add(hint)
+        new_state.rehash(self.game)
         if verbose: print(str(player))
         return new_state
 
@@ -816,7 +1199,7 @@ class Player:
         player = new_state.get_player(self.game.players.index(self)) #get player in new state
         try: player.hand = player.hand.process_guess(position, guess)
         except (HanabiSimException, HanabiIndexException) as e: raise e
-        new_state.previous_state = self.game
+        new_state.rehash(self.game)
         if verbose: print(str(player))
         return new_state
 
@@ -843,14 +1226,21 @@ class Player:
         player = new_state.get_player(self.game.players.index(self)) #get player in new state
         try: player.hand = player.hand.process_swap(pos1, pos2)
         except HanabiIndexException as e: raise e
-        new_state.previous_state = self.game
+        new_state.rehash(self.game)
         if verbose: print(str(player))
         return new_state
 
-    def copy(self):
-        cpy = Player(self.name, 0, self.game, self.replenishment_protocol)
-        cpy.hand = self.hand.copy()
-        cpy.game = self.game
+    def copy(self, game=None):
+        """
+        A copy of this player belonging to game (by default, the same game).
+        The hand is immutable and is shared rather than copied.
+        """
+        #bypass __init__, which would build a hand only to replace it
+        cpy = Player.__new__(Player)
+        cpy.name = self.name
+        cpy.hand = self.hand
+        cpy.replenishment_protocol = self.replenishment_protocol
+        cpy.game = game if game else self.game
         return cpy
 
     def __str__(self):
@@ -2,8 +2,13 @@ from enum import Enum
 import random
 import readline
 import argparse
+import sys
 
 import util
+import inference
+import sampler
+import endgame
+from history import History, DEFAULT_SNAPSHOTS, DEFAULT_CHECKPOINT_EVERY
 from game_objects import *
 
 def handle_help(choice):
@@ -37,6 +42,10 @@ def handle_help(choice):
            text = util.help_guess
         case ['undo'] | ['u']:
            text = util.help_undo
+        case ['redo'] | ['r']:
+           text = util.help_redo
+        case ['goto'] | ['go']:
+           text = util.help_goto
         case ['swap']: #TODO 'w' as a short form?
            text = util.help_swap
         case ['quit'] | ['q']:
@@ -50,7 +59,7 @@ def handle_about(options):
     return util.help_about
 
 #The logic for the "show" command
-def handle_show(choice, game):
+def handle_show(choice, game, history=None):
     match choice:
         case []:
             text = 'This command requires further arguments; try "help show"'
@@ -70,16 +79,71 @@ def handle_show(choice, game):
             except ValueError: return f'Expected an integer card position; yours: {position}.'
             if not 1 <= position <= len(player.hand):
                 return f'Position {position} is out of range'
-            text = '{player.name} card {position}:\n{player.represent_card(position - 1)}'
+            text = f'{player.name} card {position}:\n{player.represent_card(position - 1)}'
         case ['card', *args] | ['c', *args]:
             text = 'Additional input required for card histroy; see "help show"'
         case ['hand', *args] | ['h', *args]:
+            deduce = bool(args) and args[-1] in {'deduce', 'x'}
+            if deduce: args = args[:-1]
             if len(args) > 1: return f'Unrecognized arguments {", ".join(args)}; try "help show"'
             try: player_request = args[0]
             except: player_request = game.player_up + 1 #default is player up
             try: player = util.resolve_player(player_request, game)
             except (KeyError, IndexError) as e: return e.args[0]
-            text = str(player)
+            if not deduce:
+                return str(player)
+            try: masks = inference.deduce(game)[game.players.index(player)]
+            except HanabiSimException as e: return e.args[0]
+            hand = player.hand.copy()
+            notes = []
+            for i, (card, mask) in enumerate(zip(player.hand.hand, masks)):
+                if mask == card.mask: continue
+                hand.hand[i] = card.copy()
+                hand.hand[i].mask = mask
+                ruled_out = [card_at_index(j) for j in range(NUM_IDENTITIES)
+                             if card.mask >> j & 1 and not mask >> j & 1]
+                notes.append(f'Card {i + 1} cannot be {", ".join(map(str, ruled_out))}')
+            text = f'{player.name}:\n{hand}'
+            text += '\n' + '\n'.join(notes) if notes else '\nNothing further deduced'
+        case ['weights', *args] | ['w', *args]:
+            exact = bool(args) and args[-1] in {'exact', 'x'}
+            if exact: args = args[:-1]
+            if len(args) > 1: return f'Unrecognized arguments {", ".join(args)}; try "help show"'
+            try: player_request = args[0]
+            except: player_request = game.player_up + 1 #default is player up
+            try: player = util.resolve_player(player_request, game)
+            except (KeyError, IndexError) as e: return e.args[0]
+            weights = game.hand_weights(game.players.index(player), exact=exact)
+            text = f'{player.name}:\n{inference.represent_weights(weights)}'
+        case ['sample', *args] | ['m', *args]:
+            if len(args) > 2: return f'Unrecognized arguments {", ".join(args)}; try "help show"'
+            try: player_request = args[0]
+            except: player_request = game.player_up + 1 #default is player up
+            try: player = util.resolve_player(player_request, game)
+            except (KeyError, IndexError) as e: return e.args[0]
+            try: deals = int(args[1]) if len(args) > 1 else sampler.DEFAULT_SAMPLES
+            except ValueError: return f'Expected an integer number of deals; yours: {args[1]}.'
+            if deals <= 0: return 'The number of deals must be positive'
+            estimate = sampler.sample_game(game, deals)
+            try: text = f'{player.name} ({estimate}):\n'\
+                        f'{estimate.represent(game.players.index(player))}'
+            except HanabiSimException as e: return e.args[0]
+        case ['endgame', *args] | ['e', *args]:
+            if len(args) > 1: return f'Unrecognized arguments {", ".join(args)}; try "help show"'
+            try: budget = float(args[0]) if args else endgame.DEFAULT_BUDGET
+            except ValueError: return f'Expected a number of seconds; yours: {args[0]}.'
+            try: analysis = endgame.analyze(game, budget)
+            except HanabiSimException as e: return e.args[0]
+            text = f'{game.players[game.player_up].name} to move; {analysis}\n{analysis.represent()}'
+        case ['cache']:
+            text = str(inference.cache)
+        case ['memory']:
+            if history is None: return 'No history is kept'
+            whole, deltas = history.memory()
+            text = tabulate([['versions', 'kept whole', 'whole versions', 'deltas', 'total'],
+                             [len(history), len(history.snapshots), f'{whole} bytes',
+                              f'{deltas} bytes', f'{whole + deltas} bytes']],
+                            headers='firstrow', tablefmt='pretty')
         case ['info', *args] | ['i', *args]:
             match args:
                 case ['play', *sort] | ['p', *sort]:
@@ -184,7 +248,7 @@ def handle_play(choice, game, verbose=False):
     player = game.get_player(game.player_up)
     try:
         new_state = player.perform_play(position - 1, card, verbose=verbose)
-    except HanabiRulesException:
+    except HanabiRulesException as e:
         return game, e.args[0]
     except HanabiSimException as e:
         return game, e.args[0]
@@ -211,7 +275,7 @@ def handle_hint(choice, game, verbose=False):
         #player given by name
         target_player = choice[0]
     try: target_player = game.get_player(target_player)
-    except (IndexError, KeyError): return game, e.args[0]
+    except (IndexError, KeyError) as e: return game, e.args[0]
     #resolve hint
     try: hint = util.read_color_or_number(hint)
     except HanabiSimException as e: return game, e.args[0]
@@ -299,92 +363,150 @@ def handle_swap(choice, game, verbose=False):
         return game, f'Card {e.index + 1}: {e.args[0]}'
     return new_state, 'Success'
 
+#Commands which only report on the game and never change it
+QUERY_COMMANDS = {'help', '?', 'about', 'a', 'show', 's'}
+
+def handle_navigation(choice, options, history):
+    """
+    Move through the versions of the game kept in history, for undo, redo, and goto.
+    Return the version moved to (the current one if the move failed) and the text to report.
+    """
+    current = history.game
+    try:
+        match choice, options:
+            case ('undo' | 'u'), []:
+                game, verb = history.undo(), 'Reverting to prior state'
+            case ('redo' | 'r'), []:
+                game, verb = history.redo(), 'Redoing undone state'
+            case ('goto' | 'go'), ['turn' | 't', turn]:
+                try: turn = int(turn)
+                except ValueError: return current, f'Expected an integer turn; yours: {turn}.'
+                game, verb = history.goto(turn), f'Going to the start of turn {turn}'
+            case ('goto' | 'go'), [rnd, player]:
+                try: rnd = int(rnd)
+                except ValueError: return current, f'Expected an integer round; yours: {rnd}.'
+                player = util.resolve_player(player, current)
+                turn = history.turn_of(rnd, current.players.index(player))
+                game, verb = history.goto(turn), f'Going to the start of turn {turn}'
+            case _:
+                return current, f'Unrecognized options: {", ".join(options)}'
+    except (HanabiSimException, IndexError, KeyError) as e:
+        return current, e.args[0]
+    if game is current:
+        return current, f'Already at the start of turn {len(current.turns_taken) + 1}'
+    return game, f'{verb}; round: {game.round}, player up: {game.players[game.player_up].name}'
+
+#Commands which move among the versions of the game rather than make a new one
+NAVIGATION_COMMANDS = {'undo', 'u', 'redo', 'r', 'goto', 'go'}
+
+def handle_command(choice, game, verbose=False, history=None):
+    """
+    Carry out one command, already split into words, against game.
+    Return the resulting game state (game itself if nothing changed) and the text
+    to report to the user, or None if there is nothing to report.
+    If history (a History whose current version is game) is given, new versions are
+    recorded in it, and undo, redo and goto move through it; without it, they fail.
+    """
+    text = None
+    if history is not None and choice and choice[0] in NAVIGATION_COMMANDS:
+        return handle_navigation(choice[0], choice[1:], history)
+    match choice:
+        case []:
+            pass
+        case ['help', *options] | ['?', *options]:
+            text = handle_help(options)
+        case ['about', *options] | ['a', *options]:
+            text = handle_about(options)
+        case ['show', *options] | ['s', *options]:
+            text = handle_show(options, game, history)
+        case ['play', *options] | ['p', *options]:
+            game, text = handle_play(options, game, verbose=verbose)
+        case ['hint', *options] | ['h', *options]:
+            game, text = handle_hint(options, game, verbose=verbose)
+        case ['discard', *options] | ['d', *options]:
+            game, text = handle_discard(options, game, verbose=verbose)
+        case ['guess', *options] | ['g', *options]:
+            game, text = handle_guess(options, game, verbose=verbose)
+        case [('undo' | 'u' | 'redo' | 'r' | 'goto' | 'go'), *options]:
+            text = 'Cannot move through the game; no history is kept'
+        case ['swap', *options]:
+            game, text = handle_swap(options, game, verbose=verbose)
+        case ['quit', *options] | ['q', *options]:
+            if options:
+                text = f'Unrecognized options: {", ".join(options)}'
+            else:
+                text = 'Quitting game'
+                game.over = True
+        case [command, *options]:
+            text = f'Unrecognized command "{command}"; try "help"'
+    if history is not None and game is not history.game:
+        history.record(game)
+    return game, text
+
  
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(prog='hanabi_sim',
                                      description='A tracker for public information in hanabi',
     )
-    parser.add_argument('-i', '--infile')
+    parser.add_argument('-i', '--infile', help='file of commands to start with ("-" for stdin)')
     parser.add_argument('-o', '--outfile')
     parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('-w', '--weights', nargs='?', const='marginal', choices=['marginal', 'exact'],
+                        help='after each action, show the chances for the cards it affected')
+    parser.add_argument('--snapshots', type=int, default=DEFAULT_SNAPSHOTS,
+                        help='number of recent versions of the game to keep whole for undo')
+    parser.add_argument('--checkpoint-every', type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                        help='also keep every this many versions whole (0 for none)')
+    parser.add_argument('--cache-size', type=int, default=inference.DEFAULT_CACHE_SIZE,
+                        help='number of inference results to keep (0 to keep none)')
     args = parser.parse_args()
+    inference.cache.resize(args.cache_size)
     outfile_name, outfile = (args.outfile, None) if args.outfile else (None, None)
     infile_name,  infile  = (args.infile,  None) if args.infile  else (None, None)
     verbose = args.verbose
-    setup_choices = []
-    if infile_name:
-        try:
-            infile = open(infile_name, 'r')
-            setup_choices = infile.readlines()
-            infile.close()
-        except:
-            if infile: del infile
+    if infile_name == '-':
+        infile = sys.stdin
+    elif infile_name:
+        try: infile = open(infile_name, 'r')
+        except OSError:
             print(f'Error reading infile; {infile_name}; infile use aborted.')
+    #commands are read from the infile a line at a time, then from the user
+    source = util.CommandSource(infile)
     if outfile_name:
         outfile = open(outfile_name, 'w')
 
     color_picker = util.generate_color()
     try:
-        players, protocols = util.get_players(setup_choices, outfile, color_picker)
+        players, protocols = util.get_players(source, outfile, color_picker)
     except (KeyboardInterrupt, EOFError):
         print('\nProgram terminated by user.')
         exit(0)
     game = GameState(players, protocols)
+    history = History(game, args.snapshots, args.checkpoint_every)
+    live = inference.LiveWeights(game, exact=args.weights == 'exact') if args.weights else None
 
     while (not game.over):
         prompt = f'Ask for information with "?" or make a play '\
                  f'(player up: {game.get_player(game.player_up).name}):' 
         try:
-            choice = setup_choices.pop(0).strip() if setup_choices else \
-                     input(style_text(next(color_picker), prompt))
+            choice = source.read(style_text(next(color_picker), prompt))
         except (KeyboardInterrupt, EOFError):
             print('\nProgram terminated by user.')
             exit(0)
         if outfile:
             outfile.write(choice + '\n')
         choice = util.trim_comment(choice, util.COMMENT_START).split()
-        match choice:
-            case []:
-                continue
-            case ['help', *options] | ['?', *options]:
-                print(handle_help(options))
-            case ['about', *options] | ['a', *options]:
-                print(handle_about(options))
-            case ['show', *options] | ['s', *options]:
-                print(handle_show(options, game))
-            case ['play', *options] | ['p', *options]:
-                game, text = handle_play(options, game, verbose=verbose)
-                print(text)
-            case ['hint', *options] | ['h', *options]:
-                game, text = handle_hint(options, game, verbose=verbose)
-                print(text)
-            case ['discard', *options] | ['d', *options]:
-                game, text = handle_discard(options, game, verbose=verbose)
-                print(text)
-            case ['guess', *options] | ['g', *options]:
-                game, text = handle_guess(options, game, verbose=verbose)
-                print(text)
-            case ['undo', *options] | ['u', *options]:
-                if options:
-                    text = f'Unrecognized options: {", ".join(options)}'
-                else:
-                    text = f'Reverting to prior state; round: {game.previous_state.round}, '\
-                    f'player up: {game.previous_state.players[game.previous_state.player_up].name}'\
-                    if game.previous_state else 'Cannot revert; no previous state to revert to'
-                    game = game.previous_state if game.previous_state else game
-                print(text)
-            case ['swap', *options]:
-                game, text = handle_swap(options, game, verbose=verbose)
-                print(text)
-            case ['quit', *options] | ['q', *options]:
-                if options:
-                    text = f'Unrecognized options: {", ".join(options)}'
-                else:
-                    text = 'Quitting game'
-                    game.over = True
-                print(text)
+        game, text = handle_command(choice, game, verbose=verbose, history=history)
+        if text is not None:
+            print(text)
+        if live and choice and choice[0] not in QUERY_COMMANDS:
+            live = live.follow(game)
+            for p in live.changed:
+                print(f'{game.players[p].name}:\n'
+                      f'{inference.represent_weights(live.weights[p], live.totals[p])}')
 
+    source.close()
     if outfile:
         outfile.close()
     print('Game is over')
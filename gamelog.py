@@ -0,0 +1,276 @@
+"""
+A compact binary form of hanabi-sim command logs, and converters to and from text.
+
+Layout (all integers unsigned, multi-byte ones big-endian):
+    MAGIC, then the number of players (1 byte), then for each player:
+        replenishment protocol (1 byte, index into PROTOCOLS),
+        length of name in bytes (1 byte), name (UTF-8);
+    then one 16-bit word per command which changed the game, in order.
+
+A word's top 3 bits give the command; the rest are packed as follows, where a
+card is its identity index (see game_objects.card_index) and a hint or guess
+value is 0-4 for a color (Color.value - 1) or 5-9 for a number (number + 4):
+    PLAY, DISCARD   bits 12-10 position, 4-0 card
+    HINT            bits 12-10 target player, 9-5 positions (bit i = position i), 4-0 value
+    GUESS           bits 12-10 player, 9-7 position, 4-0 value
+    SWAP            bits 12-10 player, 9-7 first position, 6-4 second position
+    UNDO, QUIT      no operands
+    TRAVEL          bit 12 clear: redo, no operands; set: goto, bits 11-0 turn
+
+Only the game is kept; comments, queries, spelling, and commands which failed are
+dropped, so converting text to binary and back gives an equivalent, tidier log.
+"""
+import argparse
+import sys
+from enum import IntEnum
+
+import util
+import replay
+from game_objects import *
+from history import History
+
+MAGIC = b'HSG\x01'
+PROTOCOLS = ['in_place', 'left_shift', 'right_shift']
+WORD_SIZE = 2
+
+
+class Op(IntEnum):
+    """
+    The command a word stands for (its top 3 bits).
+    """
+    PLAY = 0
+    DISCARD = 1
+    HINT = 2
+    GUESS = 3
+    SWAP = 4
+    UNDO = 5
+    QUIT = 6
+    TRAVEL = 7 #redo or goto
+
+
+def value_code(value):
+    """
+    The code for a hint or guess value (a Color or a number).
+    """
+    if isinstance(value, Color):
+        return value.value - 1
+    return len(Color) + value - MIN_CARD_VALUE
+
+def code_value(code):
+    """
+    The hint or guess value (a Color or a number) for a code; see value_code.
+    """
+    if code < len(Color):
+        return Color(code + 1)
+    return code - len(Color) + MIN_CARD_VALUE
+
+def encode_setup(players, protocols):
+    data = bytearray(MAGIC)
+    data.append(len(players))
+    for name, protocol in zip(players, protocols):
+        name = name.encode()
+        data += bytes([PROTOCOLS.index(protocol), len(name)]) + name
+    return data
+
+def decode_setup(data):
+    """
+    Read the header of a binary log.  Return the players, their protocols, and the
+    offset at which the commands begin.
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise HanabiSimException('Not a binary hanabi-sim log.')
+    offset = len(MAGIC)
+    players, protocols = [], []
+    for _ in range(data[offset]):
+        protocols.append(PROTOCOLS[data[offset + 1]])
+        length = data[offset + 2]
+        players.append(bytes(data[offset + 3:offset + 3 + length]).decode())
+        offset += 2 + length
+    return players, protocols, offset + 1
+
+def words(data, offset):
+    """
+    Yield the command words of a binary log, starting at offset.
+    """
+    for i in range(offset, len(data) - 1, WORD_SIZE):
+        yield data[i] << 8 | data[i + 1]
+
+def encode_command(choice, before, after):
+    """
+    The word for a command (split into words) which took the game from before to after.
+    """
+    match choice[0]:
+        case 'play' | 'p' | 'discard' | 'd':
+            card = after.turns_taken[-1].card
+            op = Op.PLAY if choice[0] in {'play', 'p'} else Op.DISCARD
+            return op << 13 | (int(choice[1]) - 1) << 10 | card.index
+        case 'hint' | 'h':
+            action = after.turns_taken[-1]
+            positions = sum([1 << p for p in action.positions])
+            return Op.HINT << 13 | action.targetplayer_index << 10 | positions << 5 \
+                   | value_code(action.hint)
+        case 'guess' | 'g':
+            player = before.players.index(util.resolve_player(choice[1], before))
+            return Op.GUESS << 13 | player << 10 | (int(choice[2]) - 1) << 7 \
+                   | value_code(util.read_color_or_number(choice[3]))
+        case 'swap':
+            player = before.players.index(util.resolve_player(choice[1], before))
+            return Op.SWAP << 13 | player << 10 | (int(choice[2]) - 1) << 7 \
+                   | (int(choice[3]) - 1) << 4
+        case 'undo' | 'u':
+            return Op.UNDO << 13
+        case 'redo' | 'r':
+            return Op.TRAVEL << 13
+        case 'goto' | 'go':
+            #goto by round and player lands on a turn too; record the turn
+            return Op.TRAVEL << 13 | 1 << 12 | len(after.turns_taken) + 1
+        case 'quit' | 'q':
+            return Op.QUIT << 13
+    raise HanabiSimException(f'Cannot encode command {" ".join(choice)}')
+
+def encode_text(lines):
+    """
+    Convert a text log (any iterable of lines) to binary.  Return the binary log
+    and the ReplayResult of replaying the text, whose errors are the lines dropped.
+    """
+    data = bytearray()
+    def record(choice, before, after):
+        data.extend(encode_command(choice, before, after).to_bytes(WORD_SIZE, 'big'))
+    result = replay.replay(lines, on_change=record)
+    if result.game is None:
+        return None, result
+    players = [p.name for p in result.game.players]
+    protocols = [p.replenishment_protocol for p in result.game.players]
+    return bytes(encode_setup(players, protocols) + data), result
+
+def command_text(word):
+    """
+    The text command for a word.
+    """
+    op, operands = word >> 13, word & 0x1fff
+    match op:
+        case Op.PLAY | Op.DISCARD:
+            card = card_at_index(operands & 0x1f)
+            return f'{"p" if op == Op.PLAY else "d"} {(operands >> 10) + 1} '\
+                   f'{card.number}{card.color.name[0].lower()}'
+        case Op.HINT:
+            positions = [str(i + 1) for i in range(5) if operands >> 5 & 1 << i]
+            value = code_value(operands & 0x1f)
+            value = value.name[0].lower() if isinstance(value, Color) else value
+            return f'h {(operands >> 10) + 1} {" ".join(positions)} {value}'
+        case Op.GUESS:
+            value = code_value(operands & 0x1f)
+            value = value.name[0].lower() if isinstance(value, Color) else value
+            return f'g {(operands >> 10) + 1} {(operands >> 7 & 0x7) + 1} {value}'
+        case Op.SWAP:
+            return f'swap {(operands >> 10) + 1} {(operands >> 7 & 0x7) + 1} '\
+                   f'{(operands >> 4 & 0x7) + 1}'
+        case Op.UNDO:
+            return 'u'
+        case Op.QUIT:
+            return 'q'
+        case Op.TRAVEL:
+            return f'go t {operands & 0xfff}' if operands >> 12 else 'r'
+    raise HanabiSimException(f'Unknown command code {op}')
+
+def decode_text(data):
+    """
+    Convert a binary log to a list of text lines, as game_sim.py -o would record them.
+    """
+    players, protocols, offset = decode_setup(data)
+    lines = []
+    for name, protocol in zip(players, protocols):
+        lines += [name, protocol]
+    if len(players) < GameState.MAX_PLAYERS:
+        lines.append('') #ends player entry
+    return lines + [command_text(word) for word in words(data, offset)]
+
+def apply_command(word, game, history, verbose=False):
+    """
+    Carry out the command a word stands for, going straight to the game objects;
+    game is the current version in history, in which a new version is recorded.
+    Return the new game state; raises as the game objects do on illegal commands.
+    """
+    op, operands = word >> 13, word & 0x1fff
+    match op:
+        case Op.PLAY:
+            new_game = game.get_player(game.player_up).perform_play(
+                           operands >> 10, card_at_index(operands & 0x1f), verbose=verbose)
+        case Op.DISCARD:
+            new_game = game.get_player(game.player_up).perform_discard(
+                           operands >> 10, card_at_index(operands & 0x1f), verbose=verbose)
+        case Op.HINT:
+            positions = [i for i in range(5) if operands >> 5 & 1 << i]
+            new_game = game.get_player(game.player_up).perform_hint(
+                           game.get_player(operands >> 10), positions,
+                           code_value(operands & 0x1f), verbose=verbose)
+        case Op.GUESS:
+            new_game = game.get_player(operands >> 10).perform_guess(
+                           operands >> 7 & 0x7, code_value(operands & 0x1f), verbose=verbose)
+        case Op.SWAP:
+            new_game = game.get_player(operands >> 10).perform_swap(
+                           operands >> 7 & 0x7, operands >> 4 & 0x7, verbose=verbose)
+        case Op.UNDO:
+            return history.undo()
+        case Op.TRAVEL:
+            return history.goto(operands & 0xfff) if operands >> 12 else history.redo()
+        case Op.QUIT:
+            game.over = True
+            return game
+        case _:
+            raise HanabiSimException(f'Unknown command code {op}')
+    history.record(new_game)
+    return new_game
+
+def replay_binary(data, verbose=False):
+    """
+    Replay a binary log; the counterpart of replay.replay for text logs.
+    Errors are numbered by command rather than by line.
+    """
+    players, protocols, offset = decode_setup(data)
+    game = GameState(players, protocols)
+    history = History(game)
+    errors = []
+    number = 0
+    for number, word in enumerate(words(data, offset), 1):
+        try: game = apply_command(word, game, history, verbose=verbose)
+        except (HanabiRulesException, HanabiSimException, ValueError, IndexError) as e:
+            errors.append(replay.ReplayError(number, command_text(word), str(e.args[0])))
+        except HanabiIndexException as e:
+            errors.append(replay.ReplayError(number, command_text(word),
+                                             f'Card {e.index + 1}: {e.args[0]}'))
+        if game.over:
+            break
+    return replay.ReplayResult(game, errors, number)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='gamelog',
+                                     description='Convert hanabi-sim logs between text and binary',
+    )
+    parser.add_argument('direction', choices=['encode', 'decode'],
+                        help='encode: text to binary; decode: binary to text')
+    parser.add_argument('infile')
+    parser.add_argument('outfile', help='"-" for standard output (decode only)')
+    args = parser.parse_args()
+
+    if args.direction == 'encode':
+        with open(args.infile, 'r') as infile:
+            data, result = encode_text(infile)
+        for error in result.errors:
+            print(f'dropped {error}', file=sys.stderr)
+        if data is None:
+            print(f'{args.infile}: no game (setup incomplete)', file=sys.stderr)
+            exit(1)
+        with open(args.outfile, 'wb') as outfile:
+            outfile.write(data)
+    else:
+        with open(args.infile, 'rb') as infile:
+            lines = decode_text(infile.read())
+        text = '\n'.join(lines) + '\n'
+        if args.outfile == '-':
+            sys.stdout.write(text)
+        else:
+            with open(args.outfile, 'w') as outfile:
+                outfile.write(text)
@@ -0,0 +1,244 @@
+"""
+The versions a game has been through, for moving back and forth among them: undo, redo,
+and going straight to the start of any turn.
+
+Only some versions are kept whole: the first, every checkpoint_every-th, and the most
+recent few.  Between consecutive versions a Delta records only what changed, and any
+other version is rebuilt on demand from the nearest one at hand, by applying deltas
+forwards or backwards.  So the memory a long game's history takes is bounded by the
+number of whole versions kept, plus a small delta per version.
+"""
+from game_objects import *
+from util import deep_sizeof
+
+DEFAULT_SNAPSHOTS = 16 #the most recent versions kept whole
+DEFAULT_CHECKPOINT_EVERY = 32 #and every this many versions, for rebuilding from
+
+
+class Delta:
+    """
+    What changed from one version of a game to the next, which can be applied to either
+    to get the other.  It refers to neither version, nor to their hands or action logs,
+    so that it stays small: the scalars, and the length of the action log, are kept as
+    the steps taken from one version to the next (tuples of steps are shared between
+    the deltas which take them); the piles as the card played, or discarded, which is
+    also the card no longer outstanding; and each changed hand as (player, start,
+    cards before, cards after) for the run of slots which changed.  The action log of
+    either version is a prefix of the log of the line of play (see History.log).
+    """
+    __slots__ = ('steps', 'played', 'discarded', 'hands')
+
+    SCALARS = ('hints', 'misfires', 'player_up', 'round', 'num_in_deck', 'over')
+    STEPS = {} #each tuple of steps taken, to share
+
+    def __init__(self, before, after):
+        steps = tuple([getattr(after, field) - getattr(before, field) for field in self.SCALARS]
+                      + [len(after.turns_taken) - len(before.turns_taken)])
+        self.steps = self.STEPS.setdefault(steps, steps)
+        self.played = None
+        if after.play is not before.play:
+            self.played = [card for card in after.play.values() if before.play[card.color] != card][0]
+        self.discarded = None
+        if after.discard is not before.discard:
+            for color in Color:
+                new, old = after.discard.cards[color], before.discard.cards[color]
+                if new is not old:
+                    self.discarded = [card for card in new if new.count(card) > old.count(card)][0]
+        self.hands = ()
+        for p, (old, new) in enumerate(zip(before.players, after.players)):
+            if old.hand is not new.hand:
+                start, old_cards, new_cards = changed_slots(old.hand.hand, new.hand.hand)
+                if old_cards or new_cards:
+                    self.hands += ((p, start, old_cards, new_cards),)
+
+    def apply(self, game, log, forward=True):
+        """
+        The version after game (or, if not forward, before it); log is an action log of
+        which the logs of both are prefixes.
+        """
+        state = game.copy()
+        sign = 1 if forward else -1
+        for field, step in zip(self.SCALARS, self.steps):
+            if step:
+                value = getattr(state, field)
+                setattr(state, field, type(value)(value + sign * step)) #over stays a bool
+        if self.played:
+            state.play = state.play.add(self.played) if forward else state.play.remove(self.played)
+        if self.discarded:
+            state.discard = state.discard.add(self.discarded) if forward \
+                            else state.discard.remove(self.discarded)
+        revealed = self.played or self.discarded
+        if revealed:
+            state.outstanding_cards = state.outstanding_cards.remove(revealed) if forward \
+                                      else state.outstanding_cards.add(revealed)
+        if self.steps[-1]:
+            state.turns_taken = log.prefix(len(state.turns_taken) + sign * self.steps[-1])
+        for p, start, old_cards, new_cards in self.hands:
+            before, after = (old_cards, new_cards) if forward else (new_cards, old_cards)
+            player = state.players[p]
+            player.hand = player.hand.copy()
+            player.hand.hand[start:start + len(before)] = after
+        state.rehash(game)
+        return state
+
+
+def changed_slots(old, new):
+    """
+    The run of slots in which two lists of cards differ, as the index at which it
+    starts and the cards of each list in it; what surrounds it is the same cards.
+    """
+    start = 0
+    while start < min(len(old), len(new)) and old[start] is new[start]:
+        start += 1
+    end_old, end_new = len(old), len(new)
+    while end_old > start and end_new > start and old[end_old - 1] is new[end_new - 1]:
+        end_old, end_new = end_old - 1, end_new - 1
+    return start, tuple(old[start:end_old]), tuple(new[start:end_new])
+
+
+class History:
+    """
+    The versions of a game along its current line of play, oldest first, and which of
+    them is current.  Versions after the current one are those undone, which redo and
+    goto can return to until a new version is recorded in their place.
+
+    snapshots maps the index of each version kept whole to it, and deltas[k] takes
+    version k to version k + 1.  game, the current version, is always at hand, whole.
+    log is the action log of the last version, of which the log of every version
+    along the line is a prefix.
+
+    turn_index[t] is the index of the last version with t turns taken: the game as it
+    stood when turn t + 1 began, with any guesses and swaps made before it.  Versions
+    only ever gain turns along the line, so the index is kept up as versions are
+    recorded, and finding the version to go to is a lookup.
+    """
+    def __init__(self, game, snapshots=DEFAULT_SNAPSHOTS, checkpoint_every=DEFAULT_CHECKPOINT_EVERY):
+        self.keep = snapshots
+        self.checkpoint_every = checkpoint_every
+        self.snapshots = {0 : game}
+        self.deltas = []
+        self.current = 0
+        self.game = game
+        self.log = game.turns_taken
+        self.turn_index = [0] * (len(game.turns_taken) + 1)
+
+    def kept_whole(self, index):
+        """
+        Whether the version at index is one kept whole while the current one is the last.
+        """
+        return index == 0 or index > len(self.deltas) - self.keep \
+               or (self.checkpoint_every > 0 and index % self.checkpoint_every == 0)
+
+    def record(self, game):
+        """
+        Make game, which follows the current version, the current version, dropping
+        any versions which were undone.
+        """
+        del self.deltas[self.current:]
+        for index in [i for i in self.snapshots if i > self.current]:
+            del self.snapshots[index]
+        #the current version is now the last with as many turns taken as it has
+        turns = len(self.game.turns_taken)
+        del self.turn_index[turns:]
+        self.turn_index.append(self.current)
+        self.deltas.append(Delta(self.game, game))
+        self.current += 1
+        self.snapshots[self.current] = game
+        self.game = game
+        self.log = game.turns_taken
+        for index in [i for i in self.snapshots if not self.kept_whole(i)]:
+            del self.snapshots[index]
+        turns = len(game.turns_taken)
+        del self.turn_index[turns:]
+        self.turn_index += [self.current] * (turns + 1 - len(self.turn_index))
+
+    def version(self, index):
+        """
+        The version at index, rebuilt from the nearest version at hand if not kept whole.
+        """
+        if index in self.snapshots:
+            return self.snapshots[index]
+        #nearest versions at hand: the current one, and those kept whole on either side
+        start, game = self.current, self.game
+        for i in range(index, -1, -1):
+            if i in self.snapshots:
+                if index - i < abs(index - start): start, game = i, self.snapshots[i]
+                break
+        for i in range(index, min(index + abs(index - start), len(self.deltas) + 1)):
+            if i in self.snapshots:
+                start, game = i, self.snapshots[i]
+                break
+        while start < index:
+            game = self.deltas[start].apply(game, self.log)
+            start += 1
+        while start > index:
+            start -= 1
+            game = self.deltas[start].apply(game, self.log, forward=False)
+        return game
+
+    def move(self, index):
+        self.game = self.version(index)
+        self.current = index
+        return self.game
+
+    def undo(self):
+        """
+        Go back one version; raises HanabiSimException if there is none.
+        """
+        if not self.current:
+            raise HanabiSimException('Cannot revert; no previous state to revert to')
+        return self.move(self.current - 1)
+
+    def redo(self):
+        """
+        Go forward one version, one which was undone; raises HanabiSimException if there is none.
+        """
+        if self.current == len(self.deltas):
+            raise HanabiSimException('Cannot redo; no undone state to return to')
+        return self.move(self.current + 1)
+
+    def turn_version(self, turn):
+        """
+        The index of the version at the start of turn (numbered from 1), as it stood after
+        any guesses and swaps made before the turn was taken.
+        """
+        if not 1 <= turn <= len(self.turn_index):
+            raise HanabiSimException(f'There is no turn {turn}; turns so far: 1 to '\
+                                     f'{len(self.turn_index)}')
+        return self.turn_index[turn - 1]
+
+    def goto(self, turn):
+        """
+        Go to the version at the start of turn (see turn_version).
+        """
+        return self.move(self.turn_version(turn))
+
+    def before_turn(self, turn):
+        """
+        The version at the start of turn (see turn_version), without going to it; the
+        game as the action taken that turn found it, from which the action's views of
+        the cards it concerned (e.g. HintAction.hands) are rebuilt.
+        """
+        return self.version(self.turn_version(turn))
+
+    def turn_of(self, rnd, player_index):
+        """
+        The number (from 1) of the given player's turn in the given round.
+        """
+        game = self.game
+        if not 0 <= player_index < game.num_players:
+            raise HanabiIndexException(player_index, 'Unreasonable player specified.')
+        return (rnd - game.STARTING_ROUND) * game.num_players + player_index + 1
+
+    def memory(self):
+        """
+        The bytes taken by the versions kept whole, and those taken by the deltas (and
+        the log of the line of play) beyond what they share with the whole versions (see
+        util.deep_sizeof).
+        """
+        seen = set()
+        whole = deep_sizeof([self.game, self.snapshots], seen)
+        return whole, deep_sizeof([self.deltas, self.log], seen)
+
+    def __len__(self):
+        return len(self.deltas) + 1
@@ -0,0 +1,353 @@
+"""
+Inference about the identities of the cards in players' hands from public information
+alone: the hints each card has received, which are summed up in its identity mask, and
+the copies of each card not yet seen in the play or discard piles (OutstandingCards).
+"""
+from collections import Counter, OrderedDict, deque
+from functools import lru_cache
+from math import comb, perm
+
+from tabulate import tabulate
+
+from game_objects import *
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+def card_weights(mask, counts):
+    """
+    The weight of each identity (indexed as by card_index) for a card with the given
+    identity mask, given counts of outstanding copies of each identity: the number of
+    outstanding copies if the mask allows the identity, else 0.  Divided by their sum,
+    these are the chances of each identity for a card drawn from the outstanding cards
+    which is consistent with the hints the card has received.
+    """
+    return tuple([count if mask >> i & 1 else 0 for i, count in enumerate(counts)])
+
+def hand_weights(hand, counts):
+    """
+    The identity weights (see card_weights) of each card in a hand.
+    """
+    return [card_weights(card.mask, counts) for card in hand.hand]
+
+def game_weights(game):
+    """
+    The identity weights (see card_weights) of each card in each player's hand,
+    as a list (by player) of lists (by position).
+    """
+    counts = game.outstanding_cards.counts
+    return [hand_weights(player.hand, counts) for player in game.players]
+
+def count_assignments(masks, counts, weighted=True):
+    """
+    The number of ways to give each of a group of cards, one per identity mask in masks,
+    an identity its mask allows, using no more copies of any identity than counts has.
+    If weighted, copies of an identity are told apart, so this is the number of ways to
+    deal the cards from the outstanding cards; otherwise it is the number of different
+    assignments of identities.
+    """
+    #cards with the same mask are interchangeable, so only how many of each there are matters
+    groups = Counter(masks)
+    group_masks = tuple(groups)
+    union = 0
+    for mask in group_masks:
+        union |= mask
+    supply = tuple([(i, counts[i]) for i in range(NUM_IDENTITIES) if union >> i & 1 and counts[i]])
+    return _count(group_masks, supply, tuple([groups[m] for m in group_masks]), weighted)
+
+@lru_cache(maxsize=1 << 16)
+def _count(group_masks, supply, remaining, weighted):
+    """
+    count_assignments for remaining[g] cards of mask group_masks[g], from the copies in
+    supply, a tuple of (identity, copies) pairs.  Works through the identities in turn,
+    deciding how many cards of each group take the identity.
+    """
+    if not any(remaining):
+        return 1
+    if sum(remaining) > sum([copies for _, copies in supply]):
+        return 0
+    (i, copies), rest = supply[0], supply[1:]
+    eligible = [g for g, mask in enumerate(group_masks) if mask >> i & 1 and remaining[g]]
+    total = 0
+    for taken in _allocations(eligible, remaining, copies):
+        ways = 1
+        for g in eligible:
+            ways *= comb(remaining[g], taken[g]) #which cards of the group take the identity
+        if weighted:
+            ways *= perm(copies, sum(taken.values())) #which copies they take
+        total += ways * _count(group_masks, rest,
+                               tuple([r - taken.get(g, 0) for g, r in enumerate(remaining)]),
+                               weighted)
+    return total
+
+def _allocations(eligible, remaining, copies):
+    """
+    Yield each way (a dict from group to number of cards) for the groups in eligible
+    to take between them no more than copies cards of an identity.
+    """
+    if not eligible:
+        yield {}
+        return
+    g, rest = eligible[0], eligible[1:]
+    for n in range(min(remaining[g], copies) + 1):
+        for taken in _allocations(rest, remaining, copies - n):
+            yield {g : n, **taken}
+
+def exact_hand_weights(hand, counts):
+    """
+    The identity weights of each card in a hand, like hand_weights, but counting only
+    deals of the whole hand which don't use more copies of an identity than remain,
+    so that cards which compete for the same few copies are accounted for.  The weight
+    of an identity for a card is the number of such deals in which the card has it.
+    """
+    return exact_mask_weights([card.mask for card in hand.hand], counts)
+
+def exact_mask_weights(masks, counts):
+    """
+    exact_hand_weights for a hand whose cards have the given identity masks.
+    """
+    weights = []
+    by_mask = {} #cards with the same mask have the same weights
+    for j, mask in enumerate(masks):
+        if mask not in by_mask:
+            others = masks[:j] + masks[j + 1:]
+            card = [0] * NUM_IDENTITIES
+            for i in range(NUM_IDENTITIES):
+                if mask >> i & 1 and counts[i]:
+                    fewer = [*counts]
+                    fewer[i] -= 1
+                    card[i] = counts[i] * count_assignments(others, fewer)
+            by_mask[mask] = tuple(card)
+        weights.append(by_mask[mask])
+    return weights
+
+class InferenceCache:
+    """
+    A bounded store of inference results, keyed on a canonical form of all they depend on:
+    the identity masks of a hand's cards, sorted, and the outstanding counts of the
+    identities those masks allow.  So a hand reached again by undo, by another order of
+    hints, or in another game, is looked up rather than worked out again.  Once full,
+    the result least recently asked for is dropped to make room.
+    """
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key, compute):
+        """
+        The result stored under key; if there is none, compute() is called and its
+        result stored.
+        """
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            value = compute()
+            if self.size > 0:
+                self.entries[key] = value
+                if len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+            return value
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def resize(self, size):
+        """
+        Change the number of results kept, dropping the least recently used as needed.
+        """
+        self.size = size
+        while len(self.entries) > max(size, 0):
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        asked = self.hits + self.misses
+        rate = f'{100 * self.hits / asked:.1f}%' if asked else 'n/a'
+        return f'Inference cache: {len(self)}/{self.size} results stored; '\
+               f'{self.hits} hits, {self.misses} misses (hit rate {rate})'
+
+#shared by everything which asks for inference through cached_weights or cached_count
+cache = InferenceCache()
+
+def canonical_key(masks, counts):
+    """
+    The masks, sorted, and the counts of only those identities some mask allows:
+    everything an inference about cards with these masks depends on.
+    """
+    union = 0
+    for mask in masks:
+        union |= mask
+    return tuple(sorted(masks)), tuple([count if union >> i & 1 else 0
+                                        for i, count in enumerate(counts)])
+
+def cached_weights(hand, counts, exact=False):
+    """
+    hand_weights (or, if exact, exact_hand_weights) for hand, by way of the cache.
+    """
+    masks = [card.mask for card in hand.hand]
+    sorted_masks, relevant = canonical_key(masks, counts)
+    if exact:
+        compute = lambda: tuple(exact_mask_weights(sorted_masks, relevant))
+    else:
+        compute = lambda: tuple([card_weights(mask, relevant) for mask in sorted_masks])
+    by_mask = dict(zip(sorted_masks, cache.lookup(('weights', exact, sorted_masks, relevant),
+                                                  compute)))
+    return [by_mask[mask] for mask in masks]
+
+def cached_count(masks, counts, weighted=True):
+    """
+    count_assignments, by way of the cache.
+    """
+    sorted_masks, relevant = canonical_key(masks, counts)
+    return cache.lookup(('count', weighted, sorted_masks, relevant),
+                        lambda: count_assignments(sorted_masks, relevant, weighted))
+
+class LiveWeights:
+    """
+    The identity weights of every card in every hand, for following a game as it is
+    played.  follow gives those of a later (or, after an undo, earlier) version of the
+    game, carried forward from these rather than worked out afresh: hands are shared
+    between versions until an action replaces them, so only hands which were replaced
+    are looked at, and within them only cards which are new; and where an outstanding
+    count changed, only the weight of that identity in the cards which allow it.
+    With exact, weights depend on the whole hand (see exact_hand_weights), so a hand
+    is weighed again whenever any of its cards is touched.
+    """
+    def __init__(self, game, exact=False):
+        self.exact = exact
+        self.counts = tuple(game.outstanding_cards.counts)
+        self.hands = [player.hand for player in game.players]
+        self.weights = [self.weigh(hand) for hand in self.hands]
+        self.totals = [[sum(card) for card in hand] for hand in self.weights]
+        self.changed = list(range(len(self.hands))) #players whose weights differ from before
+
+    def weigh(self, hand):
+        if self.exact:
+            return cached_weights(hand, self.counts, exact=True)
+        return [card_weights(card.mask, self.counts) for card in hand.hand]
+
+    def follow(self, game):
+        """
+        The LiveWeights of game, given that these are those of another version of it.
+        """
+        new = LiveWeights.__new__(LiveWeights)
+        new.exact = self.exact
+        new.counts = tuple(game.outstanding_cards.counts)
+        new.hands = [player.hand for player in game.players]
+        #identities whose count changed, as a mask
+        touched = 0
+        for i, (old, count) in enumerate(zip(self.counts, new.counts)):
+            if old != count: touched |= 1 << i
+        new.weights, new.totals, new.changed = [], [], []
+        for p, (old_hand, hand) in enumerate(zip(self.hands, new.hands)):
+            weights, totals = self.weights[p], self.totals[p]
+            if hand is not old_hand or any([card.mask & touched for card in hand.hand]):
+                if new.exact:
+                    weights = new.weigh(hand)
+                    totals = [sum(card) for card in weights]
+                else:
+                    weights, totals = new.carry(old_hand, hand, weights, totals, touched)
+                new.changed.append(p)
+            new.weights.append(weights)
+            new.totals.append(totals)
+        return new
+
+    def carry(self, old_hand, hand, old_weights, old_totals, touched):
+        """
+        The weights and totals of the cards in hand, reusing those of the cards it shares
+        with old_hand and updating only the entries for the touched identities.
+        """
+        known = {id(card) : (w, t) for card, w, t in zip(old_hand.hand, old_weights, old_totals)}
+        weights, totals = [], []
+        for card in hand.hand:
+            try:
+                w, total = known[id(card)]
+            except KeyError:
+                w = card_weights(card.mask, self.counts)
+                weights.append(w)
+                totals.append(sum(w))
+                continue
+            changes = card.mask & touched
+            if changes:
+                w = [*w]
+                while changes:
+                    i = (changes & -changes).bit_length() - 1
+                    total += self.counts[i] - w[i]
+                    w[i] = self.counts[i]
+                    changes &= changes - 1
+                w = tuple(w)
+            weights.append(w)
+            totals.append(total)
+        return weights, totals
+
+def deduce(game):
+    """
+    Tighten the identity masks of all cards in all hands by what the hints and the
+    outstanding cards imply together, and return them, as a list (by player) of lists
+    (by position).  The rule: if the cards whose masks lie within some set of identities
+    are as many as the outstanding copies of those identities, those cards must account
+    for all of the copies, so no other card can be any of them.  For example, if both
+    outstanding copies of a 2 are hinted down to that 2, no other card can be it.
+    Each card's mask is tried as such a set; a card is tried again only if its own mask
+    shrank or one shrank to fit inside it, until nothing changes.
+    Raises HanabiSimException if the masks need more copies of some cards than remain.
+    """
+    counts = game.outstanding_cards.counts
+    masks = [card.mask for player in game.players for card in player.hand.hand]
+    pending = deque(range(len(masks)))
+    queued = [True] * len(masks)
+    while pending:
+        c = pending.popleft()
+        queued[c] = False
+        within = masks[c]
+        inside = len([mask for mask in masks if not mask & ~within])
+        supply = sum([count for i, count in enumerate(counts) if within >> i & 1])
+        if inside > supply:
+            raise HanabiSimException(f'Inconsistent hints; {inside} cards can only be among '\
+                                     f'{supply} outstanding cards.')
+        if inside < supply:
+            continue
+        for d, mask in enumerate(masks):
+            if mask & within and mask & ~within:
+                masks[d] = mask & ~within
+                for e, other in enumerate(masks):
+                    if not queued[e] and not masks[d] & ~other:
+                        queued[e] = True
+                        pending.append(e)
+    deduced = []
+    for player in game.players:
+        deduced.append(masks[:len(player.hand)])
+        masks = masks[len(player.hand):]
+    return deduced
+
+def represent_weights(weights, totals=None):
+    """
+    Tabulate the identity weights of the cards in a hand: one column per card, listing
+    its possible identities from most to least likely, each with its chance.
+    """
+    columns = []
+    for j, card in enumerate(weights):
+        total = totals[j] if totals else sum(card)
+        ranked = sorted([(w, i) for i, w in enumerate(card) if w], key=lambda t: -t[0])
+        columns.append([
+            style_text(card_at_index(i).color, f'{card_at_index(i).color.name[0]}'\
+                                               f'{card_at_index(i).number}')
+            + f' {100 * w / total:.1f}%' for w, i in ranked
+        ])
+    if not columns:
+        return ''
+    table_length = max([len(column) for column in columns])
+    rows = [[column[i] if i < len(column) else ' ' for column in columns]
+            for i in range(table_length)]
+    return tabulate([[f'{i + 1}' for i in range(len(columns))], *rows],
+                    headers='firstrow', tablefmt='pretty')
@@ -0,0 +1,113 @@
+"""
+Measure the memory the game objects take, by replaying logs and totting up the bytes
+(see util.deep_sizeof) held by every version of each game, as analyses which keep whole
+games in memory hold them: versions share what they have in common, which is counted
+once.  Reports bytes per game and per turn, for every version of the games and for the
+final versions alone, and which classes of object the bytes go to.
+
+The figures depend only on the logs and on the Python build, which is printed with them,
+so running this on two versions of the code with the same logs compares them.
+"""
+import argparse
+import sys
+from collections import Counter
+
+from tabulate import tabulate
+
+import game_objects
+import gamelog
+import replay
+from util import deep_sizeof
+
+
+def replay_versions(path):
+    """
+    Replay the log at path; return every version its game went through, in order,
+    or None if there is no game.
+    """
+    with open(path, 'rb') as infile:
+        data = infile.read()
+    lines = gamelog.decode_text(data) if data.startswith(gamelog.MAGIC) \
+            else data.decode().splitlines()
+    versions = []
+    def on_change(choice, before, after):
+        if not versions: versions.append(before)
+        versions.append(after)
+    result = replay.replay(lines, on_change=on_change)
+    if result.game is None:
+        return None
+    return versions or [result.game]
+
+def instances(root, seen):
+    """
+    Yield each object of a class from game_objects which root refers to (directly or
+    not), once, skipping those in seen.
+    """
+    pending = [root]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        if type(obj).__module__ == game_objects.__name__ and not isinstance(obj, game_objects.Enum):
+            yield obj
+        if isinstance(obj, dict):
+            pending += obj.values()
+        elif isinstance(obj, (list, tuple)):
+            pending += obj
+        if hasattr(obj, '__dict__'):
+            pending += vars(obj).values()
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                if hasattr(obj, slot):
+                    pending.append(getattr(obj, slot))
+
+def own_size(obj):
+    """
+    The bytes an object takes itself: its slots or its __dict__, but not what they refer to.
+    """
+    return sys.getsizeof(obj) + (sys.getsizeof(obj.__dict__) if hasattr(obj, '__dict__') else 0)
+
+def measure(paths):
+    """
+    Return totals over the games in paths: the number of games and turns, the bytes taken
+    by all their versions and by their final versions, and Counters of the instances and
+    bytes (each object's own) of each class.
+    """
+    games = turns = every = final = 0
+    counts, sizes = Counter(), Counter()
+    for path in paths:
+        versions = replay_versions(path)
+        if versions is None:
+            continue
+        games += 1
+        turns += len(versions[-1].turns_taken)
+        every += deep_sizeof(versions)
+        final += deep_sizeof(versions[-1])
+        for obj in instances(versions, set()):
+            counts[type(obj).__name__] += 1
+            sizes[type(obj).__name__] += own_size(obj)
+    return games, turns, every, final, counts, sizes
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='measure_memory',
+                                     description='Measure the memory taken by replayed games',
+    )
+    parser.add_argument('logs', nargs='+', help='logs, directories of logs, or glob patterns')
+    args = parser.parse_args()
+
+    games, turns, every, final, counts, sizes = measure(replay.expand_paths(args.logs))
+    if not games:
+        print('No games to measure.')
+        exit(1)
+    print(f'Python {sys.version.split()[0]}; {games} games, {turns} turns')
+    print(tabulate([['', 'bytes per game', 'bytes per turn'],
+                    ['every version', f'{every / games:.0f}', f'{every / max(turns, 1):.0f}'],
+                    ['final version', f'{final / games:.0f}', f'{final / max(turns, 1):.0f}']],
+                   headers='firstrow', tablefmt='pretty'))
+    print(tabulate([['class', 'instances per game', 'bytes each', 'bytes per game']] +
+                   [[name, f'{counts[name] / games:.1f}', f'{sizes[name] / counts[name]:.0f}',
+                     f'{sizes[name] / games:.0f}'] for name, _ in sizes.most_common()],
+                   headers='firstrow', tablefmt='pretty'))
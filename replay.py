@@ -0,0 +1,243 @@
+"""
+Replay command logs (as recorded with game_sim.py -o) without any user interaction.
+
+The commands are carried out by the same handlers the interactive program uses,
+but nothing is printed unless asked for, and problems are collected rather than
+reported at a prompt.
+"""
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import util
+from game_sim import handle_command, QUERY_COMMANDS
+from game_objects import *
+from history import History
+
+
+class ReplayError:
+    """
+    A line of a log which could not be carried out, and why.
+    """
+    def __init__(self, line_number, line, message):
+        self.line_number = line_number #1-based, as an editor would show it
+        self.line = line
+        self.message = message
+
+    def __str__(self):
+        #handler messages may go on to show a whole card; the first line says what went wrong
+        return f'line {self.line_number} ({self.line}): {self.message.splitlines()[0]}'
+
+
+class ReplayResult:
+    """
+    The outcome of replaying a log: the final game state (None if the log ended
+    before the players were established) and any lines which failed.
+    """
+    def __init__(self, game, errors, lines_read):
+        self.game = game
+        self.errors = errors
+        self.lines_read = lines_read
+
+    def summary(self):
+        if self.game is None:
+            return 'no game (setup incomplete)'
+        return f'score {self.game.score()}, misfires {self.game.misfires}, '\
+               f'hints {self.game.hints}, errors {len(self.errors)}'
+
+
+def read_setup(lines, errors):
+    """
+    Read players and their replenishment protocols from the numbered lines given
+    (an iterator of (line_number, line)) the way util.get_players would, recording
+    problems in errors.  Return the players and protocols, or None if the lines
+    ran out first.
+    """
+    players, protocols = [], []
+    for line_number, line in lines:
+        playername = util.trim_comment(line, util.COMMENT_START).strip()
+        problem = util.check_playername(playername, len(players))
+        if problem:
+            errors.append(ReplayError(line_number, line, problem))
+            continue
+        if not playername:
+            return players, protocols
+        for line_number, line in lines:
+            protocol = util.trim_comment(line).strip()
+            if protocol.lower() in util.PROTOCOL_MAP:
+                break
+            if protocol != '?':
+                errors.append(ReplayError(line_number, line, f'Unknown protocol {protocol}'))
+        else:
+            return None
+        protocols.append(util.PROTOCOL_MAP[protocol.lower()])
+        players.append(playername)
+        if len(players) == GameState.MAX_PLAYERS:
+            return players, protocols
+    return None
+
+def replay(lines, verbose=False, echo=False, on_change=None):
+    """
+    Replay the commands in lines (any iterable of strings, such as an open file),
+    starting with the player setup, until the lines run out or the game ends.
+    verbose is passed on to the handlers as in game_sim.py; if echo is set, the
+    text the interactive program would print is printed, queries included.
+    on_change, if given, is called with the command (split into words) and the
+    game before and after for each command which changed the game.
+    Return a ReplayResult.
+    """
+    errors = []
+    numbered = ((i + 1, line.rstrip('\n')) for i, line in enumerate(lines))
+    setup = read_setup(numbered, errors)
+    if setup is None:
+        return ReplayResult(None, errors, sum([1 for _ in numbered]))
+    game = GameState(*setup)
+    history = History(game)
+    line_number = 0
+    for line_number, line in numbered:
+        choice = util.trim_comment(line, util.COMMENT_START).split()
+        if not choice:
+            continue
+        #queries can't change the game; only bother with them if the output is wanted
+        if choice[0] in QUERY_COMMANDS and not echo:
+            continue
+        new_game, text = handle_command(choice, game, verbose=verbose, history=history)
+        if echo and text is not None:
+            print(text)
+        if choice[0] in QUERY_COMMANDS:
+            pass
+        elif new_game is game and not game.over:
+            errors.append(ReplayError(line_number, line, text))
+        elif on_change:
+            on_change(choice, game, new_game)
+        game = new_game
+        if game.over:
+            break
+    return ReplayResult(game, errors, line_number)
+
+def replay_file(path, verbose=False, echo=False):
+    """
+    Replay the log at path, which may be a text log (see replay) or a binary one
+    (see gamelog.py).
+    """
+    import gamelog #imported here; gamelog builds on this module
+    with open(path, 'rb') as infile:
+        if infile.read(len(gamelog.MAGIC)) == gamelog.MAGIC:
+            return gamelog.replay_binary(gamelog.MAGIC + infile.read(), verbose=verbose)
+    with open(path, 'r') as infile:
+        return replay(infile, verbose=verbose, echo=echo)
+
+
+class ReplaySummary:
+    """
+    The headline figures from replaying one log; small enough to pass cheaply
+    between processes, unlike the game itself.
+    """
+    def __init__(self, path, result=None, problem=None):
+        self.path = path
+        self.problem = problem #set when the log couldn't be replayed at all
+        self.score = self.misfires = self.hints = None
+        self.num_errors = 0
+        self.first_error = None
+        if result is not None:
+            if result.game is None:
+                self.problem = 'no game (setup incomplete)'
+            else:
+                self.score = result.game.score()
+                self.misfires = result.game.misfires
+                self.hints = result.game.hints
+            self.num_errors = len(result.errors)
+            self.first_error = str(result.errors[0]) if result.errors else None
+
+    def ok(self):
+        return self.problem is None and self.num_errors == 0
+
+    def __str__(self):
+        if self.problem:
+            text = f'{self.path}: {self.problem}'
+        else:
+            text = f'{self.path}: score {self.score}, misfires {self.misfires}, '\
+                   f'hints {self.hints}, errors {self.num_errors}'
+        if self.first_error:
+            text += f'\n    first error: {self.first_error}'
+        return text
+
+def summarize_file(path):
+    """
+    Replay the log at path and return a ReplaySummary of it.
+    """
+    try: return ReplaySummary(path, replay_file(path))
+    except (OSError, UnicodeDecodeError) as e:
+        return ReplaySummary(path, problem=f'could not be read ({e})')
+
+def summarize_files(paths):
+    return [summarize_file(path) for path in paths]
+
+def expand_paths(specs):
+    """
+    Given file names, directory names, and glob patterns, return the log files
+    they refer to.  Directories stand for the files directly inside them.
+    """
+    paths = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            paths += sorted([entry.path for entry in os.scandir(spec) if entry.is_file()])
+        elif os.path.exists(spec):
+            paths.append(spec)
+        else:
+            #a pattern that matches nothing is kept, so that it is reported as unreadable
+            paths += sorted([p for p in glob.glob(spec, recursive=True) if os.path.isfile(p)]) \
+                     or [spec]
+    return paths
+
+def replay_many(paths, jobs=None, chunk_size=32):
+    """
+    Replay every log in paths across a pool of jobs worker processes (by default,
+    one per CPU), yielding a ReplaySummary for each as soon as its chunk of
+    chunk_size logs is done; summaries therefore do not arrive in order.
+    """
+    paths = list(paths)
+    if jobs == 1 or len(paths) <= 1:
+        for path in paths:
+            yield summarize_file(path)
+        return
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(summarize_files, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='replay',
+                                     description='Replay hanabi-sim command logs without interaction',
+    )
+    parser.add_argument('infiles', nargs='+', help='logs, directories of logs, or glob patterns')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('-e', '--echo', action='store_true',
+                        help='print what the interactive program would print')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='print only the logs which had errors')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    paths = expand_paths(args.infiles)
+    if not paths:
+        print('No logs found.')
+        exit(1)
+    failed = False
+    if args.verbose or args.echo:
+        #output from several games at once would be interleaved; go one at a time
+        summaries = (ReplaySummary(path, replay_file(path, args.verbose, args.echo))
+                     for path in paths)
+    else:
+        summaries = replay_many(paths, jobs=args.jobs)
+    for summary in summaries:
+        failed = failed or not summary.ok()
+        if args.quiet and summary.ok():
+            continue
+        print(summary, flush=True)
+    exit(1 if failed else 0)
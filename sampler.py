@@ -0,0 +1,226 @@
+"""
+Monte Carlo estimates of the identities of the cards in all hands at once, from public
+information alone: complete deals of every hand are drawn consistent with each card's
+identity mask and the outstanding cards, and the chance of each identity (or of a card
+being playable) is estimated from them, with a confidence interval.
+
+Deals are drawn one card at a time, most constrained card first, each card's identity
+chosen in proportion to the outstanding copies its mask allows which earlier cards
+haven't used.  Nothing is rejected and redrawn; instead each deal is weighted by the
+product of the totals it was drawn from, which makes the weighted deals stand for the
+true distribution (every consistent way of dealing the outstanding copies equally
+likely).  A deal which runs out of copies for some card gets weight 0.
+
+Sampling is split into chunks which run in parallel worker processes; each returns
+sums of weights from which the estimates and their intervals are put together.
+"""
+import argparse
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from tabulate import tabulate
+
+from game_objects import *
+
+DEFAULT_SAMPLES = 20000
+Z_95 = 1.96 #standard normal quantile for a 95% interval
+
+
+def playable_mask(game):
+    """
+    The identities which could be played successfully now, as a mask.
+    """
+    mask = 0
+    for color, card in game.play.cards.items():
+        if card.number < MAX_CARD_VALUE:
+            mask |= 1 << card_index(color, card.number + 1)
+    return mask
+
+
+class SampleSums:
+    """
+    Running sums over weighted deals, for the cards (flattened across hands) of one game:
+    the sum of weights and of squared weights, and for each card and identity the sums
+    of the weights and squared weights of the deals giving the card that identity.
+    Sums from separate chunks of deals are combined with add.
+    """
+    def __init__(self, num_cards):
+        self.deals = 0
+        self.weight = 0.0
+        self.weight_sq = 0.0
+        self.by_card = [[0.0] * NUM_IDENTITIES for _ in range(num_cards)]
+        self.by_card_sq = [[0.0] * NUM_IDENTITIES for _ in range(num_cards)]
+
+    def add(self, other):
+        self.deals += other.deals
+        self.weight += other.weight
+        self.weight_sq += other.weight_sq
+        for mine, theirs in zip(self.by_card + self.by_card_sq, other.by_card + other.by_card_sq):
+            for i, value in enumerate(theirs):
+                mine[i] += value
+        return self
+
+
+class Dealer:
+    """
+    Draws single deals (see the module docstring) of cards with the given masks from the
+    given outstanding counts.
+    """
+    def __init__(self, masks, counts, rng):
+        self.counts = counts
+        self.rng = rng
+        self.order = sorted(range(len(masks)), key=lambda c: masks[c].bit_count())
+        self.identities = [[i for i in range(NUM_IDENTITIES) if mask >> i & 1] for mask in masks]
+
+    def deal(self):
+        """
+        Return the identity index drawn for each card, the weight of the deal (0 if it
+        ran out of copies for some card), and the counts of the copies left undealt.
+        """
+        left = [*self.counts]
+        dealt = [None] * len(self.identities)
+        weight = 1.0
+        for c in self.order:
+            options = [left[i] for i in self.identities[c]]
+            total = sum(options)
+            if not total:
+                return dealt, 0.0, left
+            weight *= total
+            i = self.rng.choices(self.identities[c], options)[0]
+            left[i] -= 1
+            dealt[c] = i
+        return dealt, weight, left
+
+
+def draw_deals(masks, counts, deals, seed):
+    """
+    Draw deals of cards with the given masks from the given outstanding counts;
+    return their SampleSums.
+    """
+    dealer = Dealer(masks, counts, random.Random(seed))
+    sums = SampleSums(len(masks))
+    for _ in range(deals):
+        dealt, weight, _ = dealer.deal()
+        sums.deals += 1
+        if not weight:
+            continue
+        sums.weight += weight
+        sums.weight_sq += weight * weight
+        for c, i in enumerate(dealt):
+            sums.by_card[c][i] += weight
+            sums.by_card_sq[c][i] += weight * weight
+    return sums
+
+
+class SampleEstimate:
+    """
+    Estimated chances for each card in each hand of a game, from SampleSums.
+    Players and positions are indexed from 0, as in the game objects.
+    """
+    def __init__(self, game, sums):
+        self.sums = sums
+        self.playable = playable_mask(game)
+        self.offsets = [] #index of each player's first card among the flattened cards
+        offset = 0
+        for player in game.players:
+            self.offsets.append(offset)
+            offset += len(player.hand)
+        self.hand_sizes = [len(player.hand) for player in game.players]
+
+    def effective_deals(self):
+        """
+        The number of unweighted deals the weighted ones are worth (Kish's estimate).
+        """
+        return self.sums.weight ** 2 / self.sums.weight_sq if self.sums.weight_sq else 0.0
+
+    def estimate(self, player, position, identities):
+        """
+        The estimated chance that the card is one of the identities in the mask given,
+        and the half-width of a 95% confidence interval around it.
+        """
+        if not self.sums.weight:
+            raise HanabiSimException('No consistent deal was drawn; try more samples.')
+        c = self.offsets[player] + position
+        hits = sum([self.sums.by_card[c][i] for i in range(NUM_IDENTITIES) if identities >> i & 1])
+        hits_sq = sum([self.sums.by_card_sq[c][i]
+                       for i in range(NUM_IDENTITIES) if identities >> i & 1])
+        p = hits / self.sums.weight
+        #delta-method variance of a ratio estimate; the indicator is 0 or 1, so f^2 = f
+        variance = ((1 - 2 * p) * hits_sq + p * p * self.sums.weight_sq) / self.sums.weight ** 2
+        return p, Z_95 * max(variance, 0.0) ** 0.5
+
+    def represent(self, player, top=5):
+        """
+        Tabulate the estimates for a player's hand: one column per card, giving the
+        chance it is playable, then its most likely identities.
+        """
+        columns = []
+        for position in range(self.hand_sizes[player]):
+            p, half = self.estimate(player, position, self.playable)
+            column = [f'playable {100 * p:.1f}% ±{100 * half:.1f}']
+            c = self.offsets[player] + position
+            ranked = sorted(range(NUM_IDENTITIES), key=lambda i: -self.sums.by_card[c][i])
+            for i in ranked[:top]:
+                if not self.sums.by_card[c][i]: break
+                p, half = self.estimate(player, position, 1 << i)
+                card = card_at_index(i)
+                column.append(style_text(card.color, f'{card.color.name[0]}{card.number}')
+                              + f' {100 * p:.1f}% ±{100 * half:.1f}')
+            columns.append(column)
+        if not columns:
+            return ''
+        table_length = max([len(column) for column in columns])
+        rows = [[column[i] if i < len(column) else ' ' for column in columns]
+                for i in range(table_length)]
+        return tabulate([[f'{i + 1}' for i in range(len(columns))], *rows],
+                        headers='firstrow', tablefmt='pretty')
+
+    def __str__(self):
+        return f'{self.sums.deals} deals drawn, worth {self.effective_deals():.0f} '\
+               f'unweighted; intervals are 95%'
+
+
+def sample_game(game, deals=DEFAULT_SAMPLES, jobs=None, seed=None, chunk_size=5000):
+    """
+    Draw deals of every hand in game across a pool of jobs worker processes (by
+    default, one per CPU) in chunks of chunk_size; return a SampleEstimate.
+    The same seed gives the same estimate whatever the number of jobs.
+    """
+    masks = [card.mask for player in game.players for card in player.hand.hand]
+    counts = [*game.outstanding_cards.counts]
+    seed = random.randrange(1 << 32) if seed is None else seed
+    chunks = [(masks, counts, min(chunk_size, deals - start), seed + n)
+              for n, start in enumerate(range(0, deals, chunk_size))]
+    sums = SampleSums(len(masks))
+    if jobs == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            sums.add(draw_deals(*chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs or os.cpu_count(), len(chunks))) as executor:
+            for chunk_sums in executor.map(draw_deals, *zip(*chunks)):
+                sums.add(chunk_sums)
+    return SampleEstimate(game, sums)
+
+
+if __name__ == '__main__':
+    import replay
+
+    parser = argparse.ArgumentParser(prog='sampler',
+                                     description='Estimate card identities in a logged game by sampling',
+    )
+    parser.add_argument('infile', help='a game log, text or binary')
+    parser.add_argument('-n', '--deals', type=int, default=DEFAULT_SAMPLES)
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('-s', '--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    result = replay.replay_file(args.infile)
+    if result.game is None:
+        print(f'{args.infile}: no game (setup incomplete)')
+        exit(1)
+    estimate = sample_game(result.game, args.deals, jobs=args.jobs, seed=args.seed)
+    print(estimate)
+    for p, player in enumerate(result.game.players):
+        print(f'{player.name}:\n{estimate.represent(p)}')
@@ -0,0 +1,88 @@
+"""
+Random but legal text logs (see replay.py) for the tests: a real deck is shuffled and
+dealt, hidden from the game objects, and every hint, play and discard told truthfully,
+so the hints never contradict one another.
+"""
+import random
+
+COLORS = 'bgrwy'
+FREQUENCIES = [3, 2, 2, 2, 1]
+HAND_SIZES = {2 : 5, 3 : 5, 4 : 4, 5 : 4}
+
+
+def random_log(seed, num_players=None, extras=False):
+    """
+    The lines of a random game's log, ending with quit.  With extras, the game is also
+    strewn with commands which don't take turns: swaps (made in pairs, so the hand ends
+    up as it was), undo and redo, gotos there and back, and undos followed by a guess
+    and the undone command again, which branch off from the undone version.
+    """
+    rng = random.Random(seed)
+    n = num_players or rng.randint(2, 5)
+    names = [f'p{i}x' for i in range(n)]
+    protocols = [rng.choice('ilr') for _ in range(n)]
+    deck = [(c, v) for c in COLORS for v in range(1, 6) for _ in range(FREQUENCIES[v - 1])]
+    rng.shuffle(deck)
+    hands = [[deck.pop() for _ in range(HAND_SIZES[n])] for _ in range(n)]
+    lines = [line for name, protocol in zip(names, protocols) for line in (name, protocol)] + ['']
+    hints, misfires, up, turns, final = 8, 0, 0, 0, None
+    played = {c : 0 for c in COLORS}
+    while misfires < 3 and any(hands) and final != 0 and not all([v == 5 for v in played.values()]):
+        hand = hands[up]
+        if not hand:
+            up = (up + 1) % n
+            continue
+        if extras:
+            extra = rng.random()
+            if extra < 0.05 and len(hand) > 1:
+                lines += [f'swap {names[up]} 1 2'] * 2
+            elif extra < 0.10 and turns:
+                lines += ['u', 'r']
+            elif extra < 0.15 and turns:
+                lines += [f'go t {rng.randint(1, turns)}', f'go t {turns + 1}']
+        playable = [i for i, (c, v) in enumerate(hand) if played[c] + 1 == v]
+        if hints > 0 and (rng.random() < 0.45 or hints == 8):
+            target = rng.choice([i for i in range(n) if i != up and hands[i]] or [None])
+            if target is None:
+                break
+            c, v = rng.choice(hands[target])
+            value = rng.choice([c, v])
+            positions = [i + 1 for i, card in enumerate(hands[target]) if value in card]
+            command = f'h {target + 1} {" ".join(map(str, positions))} {value}'
+            hints -= 1
+        else:
+            if playable and rng.random() < 0.8:
+                i, kind = rng.choice(playable), 'p'
+            else:
+                #now and then a card is played blind, misfiring if it can't be played
+                i, kind = rng.randrange(len(hand)), 'd' if hints < 8 and rng.random() < 0.85 else 'p'
+            c, v = hand[i]
+            command = f'{kind} {i + 1} {v}{c}'
+            if kind == 'd':
+                hints += 1
+            elif played[c] + 1 == v:
+                played[c] = v
+                hints += 1 if v == 5 and hints < 8 else 0
+            else:
+                misfires += 1
+                hints += 1 if hints < 8 else 0
+            del hand[i]
+            if deck:
+                match protocols[up]:
+                    case 'i': hand.insert(i, deck.pop())
+                    case 'l': hand.append(deck.pop())
+                    case 'r': hand.insert(0, deck.pop())
+        lines.append(command)
+        other = (up + 1) % n
+        if extras and rng.random() < 0.05 and hands[other]:
+            #branch: undo the turn, guess the true color of a card the turn left alone, and
+            #take the turn again
+            lines += ['u', f'g {names[other]} 1 {hands[other][0][0]}', command]
+        up = (up + 1) % n
+        turns += 1
+        if final is None and not deck:
+            final = n
+        elif final is not None:
+            final -= 1
+    lines.append('q')
+    return lines
@@ -0,0 +1,69 @@
+"""
+CompactState, stepped by its own hint, play and discard alongside the GameState versions
+of replayed games, and converted back and forth at every step.
+"""
+import pytest
+
+import compact
+import replay
+from game_objects import *
+from random_games import random_log
+
+
+def same(game, state):
+    """
+    Whether a GameState and a CompactState hold the same public state.
+    """
+    other = compact.to_game_state(state)
+    return other == game and other.round == game.round and other.num_in_deck == game.num_in_deck \
+           and other.over == game.over and other.discard.cards == game.discard.cards \
+           and [len(player.hand) for player in other.players] == [len(player.hand) for player in game.players]
+
+def step(state, action):
+    """
+    The CompactState after the action logged for a turn.
+    """
+    if isinstance(action, HintAction):
+        return compact.hint(state, action.targetplayer_index, action.positions_mask, action.hint)
+    if isinstance(action, DiscardAction):
+        return compact.discard(state, action.position, action.card)
+    return compact.play(state, action.position, action.card)
+
+
+@pytest.mark.parametrize('seed', range(12))
+def test_steps_match_game_state(seed):
+    first = None
+    def follow(choice, before, after):
+        nonlocal first, state
+        if choice == ['q']:
+            return #marks the game over in place; no turn is taken
+        if first is None:
+            first = state = compact.from_game_state(before)
+            assert same(before, state)
+        state = step(state, after.turns_taken[-1])
+        assert same(after, state)
+        assert compact.from_game_state(after) == state
+    state = None
+    lines = random_log(seed, num_players=2 + seed % 4)
+    result = replay.replay(lines, on_change=follow)
+    assert not result.errors and first is not None
+    #the versions stepped from are left as they were
+    assert first == compact.from_game_state(GameState(*replay.read_setup(iter(enumerate(lines)), [])))
+
+def test_rules_raise_as_the_game_objects_do():
+    game = GameState(['a', 'b'], ['in_place', 'left_shift'])
+    state = compact.from_game_state(game)
+    red_1 = Card(Color.RED, 1)
+    with pytest.raises(HanabiRulesException):
+        compact.discard(state, 0, red_1)
+    with pytest.raises(HanabiRulesException):
+        compact.hint(state, 0, 1, Color.RED)
+    with pytest.raises(HanabiIndexException):
+        compact.hint(state, 1, 1 << 5, Color.RED)
+    state = compact.hint(state, 1, 0b11, Color.RED)
+    state = compact.hint(state, 0, 0b1, 2)
+    #the first card of the player up is a 2
+    with pytest.raises(HanabiIndexException):
+        compact.play(state, 0, red_1)
+    with pytest.raises(HanabiIndexException):
+        compact.play(state, 7, Card(Color.BLUE, 1))
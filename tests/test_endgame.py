@@ -0,0 +1,198 @@
+"""
+The endgame search, checked against a plain minimax over small positions: every move
+tried, nothing hashed, cards kept as they are rather than taken as dead, and the rules
+of the game objects applied afresh.
+"""
+import random
+import time
+
+import pytest
+
+import endgame
+from endgame import DEAD, Position, Search, Zobrist, reachable
+from game_objects import *
+
+NUM_VALUES = MAX_CARD_VALUE - MIN_CARD_VALUE + 1
+
+
+def minimax(hands, deck, levels, hints, misfires, up, left):
+    """
+    The best score reachable, by trying every move; hands are lists of identity indices,
+    deck the cards still to be drawn, in order, and left the turns left once the deck
+    is empty (None while it isn't).
+    """
+    if misfires > GameState.MAX_MISFIRES or left == 0 or sum(levels) == len(Color) * MAX_CARD_VALUE:
+        return sum(levels)
+    return max([minimax(*after) for _, after in successors(hands, deck, levels, hints, misfires, up, left)])
+
+def successors(hands, deck, levels, hints, misfires, up, left):
+    """
+    Yield each move open to the player up, as ('play' | 'discard', card), ('hint', None)
+    or ('pass', None), with the arguments to minimax after it.
+    """
+    hand = hands[up]
+    moves = [('play', card) for card in set(hand)]
+    if hints < GameState.MAX_HINTS: moves += [('discard', card) for card in set(hand)]
+    if hints > 0: moves.append(('hint', None))
+    for action, card in moves or [('pass', None)]:
+        new_hands, new_deck, new_levels = [*hands], deck, [*levels]
+        new_hints, new_misfires, new_left = hints, misfires, left
+        if action == 'hint':
+            new_hints -= 1
+        elif action != 'pass':
+            new_hand = [*hand]
+            new_hand.remove(card)
+            color, number = card // NUM_VALUES, card % NUM_VALUES + MIN_CARD_VALUE
+            if action == 'discard':
+                new_hints += 1
+            elif levels[color] + 1 == number:
+                new_levels[color] = number
+                if number == MAX_CARD_VALUE and hints < GameState.MAX_HINTS: new_hints += 1
+            else:
+                new_misfires += 1
+                if hints < GameState.MAX_HINTS: new_hints += 1
+            if deck:
+                new_hand.append(deck[0])
+                new_deck = deck[1:]
+                if not new_deck: new_left = len(hands) + 1 #every player, this one too, has one more turn
+            new_hands[up] = new_hand
+        if new_left is not None: new_left -= 1
+        yield (action, card), (new_hands, new_deck, new_levels, new_hints, new_misfires,
+                               (up + 1) % len(hands), new_left)
+
+def position(hands, deck, levels, hints, misfires, up, left):
+    """
+    The Position for the arguments to minimax, as analyze builds it.
+    """
+    live = lambda c: c if c % NUM_VALUES >= levels[c // NUM_VALUES] else DEAD
+    return Position(tuple([tuple(sorted([live(c) for c in hand])) for hand in hands]),
+                    tuple([live(c) for c in deck]), 0, tuple(levels), hints, misfires, up, left)
+
+def random_position(rng):
+    """
+    The arguments to minimax for a small random position.
+    """
+    num_players = rng.choice([2, 3])
+    hand_size = rng.choice([1, 2, 2, 3]) if num_players == 2 else rng.choice([1, 2])
+    levels = [rng.randrange(MAX_CARD_VALUE) for _ in Color]
+    #cards just above the fireworks, so that plenty of them are playable
+    near = [color * NUM_VALUES + level + offset for color, level in enumerate(levels)
+            for offset in (0, 0, 1) if level + offset < MAX_CARD_VALUE]
+    pick = lambda: rng.choice(near) if rng.random() < 0.7 else rng.randrange(NUM_IDENTITIES)
+    hands = [[pick() for _ in range(hand_size)] for _ in range(num_players)]
+    deck = [pick() for _ in range(rng.randint(0, 2))]
+    left = None if deck else rng.randint(1, num_players)
+    return (hands, deck, levels, rng.randint(0, GameState.MAX_HINTS),
+            rng.randint(0, GameState.MAX_MISFIRES), rng.randrange(num_players), left)
+
+def search(args, rng, deadline=float('inf')):
+    hands, deck, levels = args[:3]
+    return Search(reachable([c for hand in hands for c in hand] + deck, levels),
+                  Zobrist(len(hands), rng), deadline)
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_search_matches_minimax(seed):
+    """
+    The best score, and the best score after each move (as analyze finds them for the
+    player up), agree with minimax.
+    """
+    rng = random.Random(seed)
+    args = random_position(rng)
+    searcher = search(args, rng)
+    root = position(*args)
+    assert searcher.best(root) == minimax(*args)
+    levels = args[2]
+    for (action, card), after in successors(*args):
+        if card is not None and card % NUM_VALUES < levels[card // NUM_VALUES]:
+            card = DEAD
+        assert searcher.best(root.after((action, card))) == minimax(*after)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_search_cutoff_is_an_upper_bound(seed):
+    """
+    Searched with alpha, the result is exact if the best score beats alpha, and otherwise
+    an upper bound on it no more than alpha; the table keeps such bounds between searches.
+    """
+    rng = random.Random(seed)
+    args = random_position(rng)
+    best = minimax(*args)
+    searcher = search(args, rng)
+    for alpha in rng.sample(range(-1, len(Color) * MAX_CARD_VALUE + 1), 12) + [-1]:
+        score = searcher.best(position(*args), alpha)
+        if best > alpha:
+            assert score == best
+        else:
+            assert best <= score <= alpha
+
+def test_misfire_gives_back_a_hint():
+    yellow_2, yellow_5, red_3, yellow_1, white_5, green_2 = \
+        [card_index(color, number) for color, number in [(Color.YELLOW, 2), (Color.YELLOW, 5),
+         (Color.RED, 3), (Color.YELLOW, 1), (Color.WHITE, 5), (Color.GREEN, 2)]]
+    #with no hints, misfiring the dead yellow 2 gives back the hint which lets the next
+    #player keep both cards they need
+    args = ([[yellow_2, yellow_5], [red_3, yellow_1]], [white_5, green_2], [3, 0, 2, 4, 4], 0, 0, 0, None)
+    after = position(*args).after(('play', DEAD))
+    assert (after.hints, after.misfires) == (1, 1)
+    assert search(args, random.Random(0)).best(after) == minimax(*dict(successors(*args))[('play', yellow_2)]) == 16
+    full = position(*args[:3], GameState.MAX_HINTS, *args[4:]).after(('play', DEAD))
+    assert full.hints == GameState.MAX_HINTS
+
+
+def known_game(rng, num_players):
+    """
+    A game whose deck is empty and whose hands are all hinted down to one identity each,
+    so that analyze has a single deal to search; and the arguments to minimax for it.
+    """
+    game = GameState([f'p{i}' for i in range(num_players)], ['in_place'] * num_players)
+    levels = [rng.randrange(MAX_CARD_VALUE) for _ in Color]
+    game.play.cards = {color : Card(color, level) for color, level in zip(Color, levels)}
+    counts = [0] * NUM_IDENTITIES
+    hands = []
+    for player in game.players:
+        hand = [rng.randrange(NUM_IDENTITIES) for _ in player.hand.hand]
+        for card, i in zip(player.hand.hand, hand):
+            card.mask = 1 << i
+            counts[i] += 1
+        hands.append(hand)
+    game.outstanding_cards.counts, game.outstanding_cards.total = counts, sum(counts)
+    game.num_in_deck = 0
+    game.hints = rng.randint(1, GameState.MAX_HINTS - 1)
+    game.misfires = rng.randint(0, GameState.MAX_MISFIRES)
+    game.rehash()
+    return game, (hands, [], levels, game.hints, game.misfires, game.player_up, num_players)
+
+@pytest.mark.parametrize('num_players', [2, 3])
+@pytest.mark.parametrize('seed', range(5))
+def test_analyze_known_deal(seed, num_players):
+    rng = random.Random(seed)
+    game, args = known_game(rng, num_players)
+    analysis = endgame.analyze(game, budget=60, seed=seed, max_deals=1)
+    assert analysis.deals == 1
+    expected = {move : minimax(*after) for move, after in successors(*args)}
+    hand = args[0][game.player_up]
+    for (action, p), total in analysis.totals.items():
+        assert total / analysis.weight == expected[(action, hand[p] if p is not None else None)]
+
+def test_analyze_out_of_time(monkeypatch):
+    """
+    A search which runs out of time counts for nothing, and the analysis says so.
+    """
+    rng = random.Random(1)
+    game, _ = known_game(rng, 3)
+    clock = iter(range(1000))
+    monkeypatch.setattr(time, 'perf_counter', lambda: next(clock))
+    monkeypatch.setattr(Search, 'CHECK_EVERY', 1)
+    #the deadline is 2.5: the deal is begun at 1, and the search runs out at its second node
+    analysis = endgame.analyze(game, budget=2.5, seed=1)
+    assert (analysis.deals, analysis.weight, analysis.nodes) == (0, 0, 2)
+    assert 'No deal' in analysis.represent() and 'nan' not in analysis.represent()
+
+def test_analyze_refuses():
+    game, _ = known_game(random.Random(2), 2)
+    game.num_in_deck = endgame.MAX_DECK + 1
+    with pytest.raises(HanabiSimException):
+        endgame.analyze(game, budget=1)
+    game.num_in_deck, game.over = 0, True
+    with pytest.raises(HanabiSimException):
+        endgame.analyze(game, budget=1)
@@ -0,0 +1,128 @@
+"""
+Binary logs (gamelog.py) and archives of them (archive.py), checked by converting random
+games back and forth and replaying every form.
+"""
+import pytest
+
+import archive
+import gamelog
+import replay
+from random_games import random_log
+
+
+def signature(game):
+    """
+    What replaying a log should reproduce: the public state, the cards' histories and
+    guesses, and the number of turns taken.
+    """
+    return (game.score(), game.misfires, game.hints, game.player_up, game.round, game.over,
+            len(game.turns_taken), game.outstanding_cards.counts,
+            [[(card.mask, card.round_drawn, card.round_updated, card.turn_updated,
+               card.color_guess, card.number_guess) for card in player.hand.hand]
+             for player in game.players])
+
+def logs(count=12):
+    return [random_log(seed, num_players=2 + seed % 4, extras=True) for seed in range(count)]
+
+
+@pytest.mark.parametrize('lines', logs())
+def test_text_binary_text(lines):
+    text = replay.replay(lines)
+    assert not text.errors
+    data, result = gamelog.encode_text(lines)
+    assert data.startswith(gamelog.MAGIC) and not result.errors
+    binary = gamelog.replay_binary(data)
+    assert not binary.errors
+    assert signature(binary.game) == signature(text.game)
+    decoded = gamelog.decode_text(data)
+    assert signature(replay.replay(decoded).game) == signature(text.game)
+    #the decoded text is the tidy form, and encodes to the same bytes
+    assert gamelog.encode_text(decoded)[0] == data
+
+def test_words_cover_every_command():
+    ops = set()
+    for lines in logs():
+        data, _ = gamelog.encode_text(lines)
+        _, _, offset = gamelog.decode_setup(data)
+        for word in gamelog.words(data, offset):
+            op = word >> 13
+            ops.add((op, word >> 12 & 1) if op == gamelog.Op.TRAVEL else op)
+    assert ops >= {gamelog.Op.PLAY, gamelog.Op.DISCARD, gamelog.Op.HINT, gamelog.Op.GUESS,
+                   gamelog.Op.SWAP, gamelog.Op.UNDO, gamelog.Op.QUIT,
+                   (gamelog.Op.TRAVEL, 0), (gamelog.Op.TRAVEL, 1)}
+
+#after ten turns: undo and redo back to the last, go back to turn 4 and forward to turn 11
+TRAVEL = ['u', 'u', 'r', 'r', 'go t 4', 'go t 11', 'swap 1 1 2']
+
+def test_travel_words():
+    lines = random_log(3, num_players=3)
+    setup, commands = lines[:7], [line for line in lines[7:] if line != 'q']
+    lines = setup + commands[:10] + TRAVEL + commands[10:12]
+    data, result = gamelog.encode_text(lines)
+    assert not result.errors
+    decoded = gamelog.decode_text(data)
+    assert decoded[-len(TRAVEL) - 2:-2] == TRAVEL
+    assert signature(gamelog.replay_binary(data).game) == signature(replay.replay(lines).game)
+
+
+def test_archive_write_read(tmp_path):
+    games = logs()
+    path = tmp_path / 'games.hsa'
+    data = [gamelog.encode_text(lines)[0] for lines in games]
+    assert archive.write_archive(path, data) == len(games)
+    with archive.Archive(path) as opened:
+        assert len(opened) == len(games)
+        for n, (lines, log) in enumerate(zip(games, data)):
+            assert opened[n] == log
+            assert opened.players(n) == gamelog.decode_setup(log)[0]
+            assert signature(gamelog.replay_binary(opened[n]).game) == \
+                   signature(replay.replay(lines).game)
+        assert list(opened.find(['P1X', 'p3x'])) == [n for n, lines in enumerate(games)
+                                                     if 'p3x' in lines]
+        with pytest.raises(IndexError):
+            opened[len(games)]
+    summaries = dict(archive.replay_archive(path, jobs=1))
+    assert sorted(summaries) == list(range(len(games)))
+    assert all([summary.ok() for summary in summaries.values()])
+
+def test_archive_reads_text_and_binary(tmp_path):
+    lines = random_log(20, extras=True)
+    text_path, binary_path = tmp_path / 'game.txt', tmp_path / 'game.hsg'
+    text_path.write_text('\n'.join(lines) + '\n')
+    data = gamelog.encode_text(lines)[0]
+    binary_path.write_bytes(data)
+    assert archive.read_log(text_path) == archive.read_log(binary_path) == (data, [])
+
+def test_read_log_reports_dropped_lines(tmp_path):
+    lines = random_log(21)
+    path = tmp_path / 'game.txt'
+    path.write_text('\n'.join(lines[:12] + ['p 9 1r', 'h 1 1 purple'] + lines[12:]) + '\n')
+    data, errors = archive.read_log(path)
+    assert data == gamelog.encode_text(lines)[0]
+    assert [(error.line_number, error.line) for error in errors] == [(13, 'p 9 1r'), (14, 'h 1 1 purple')]
+
+def test_not_an_archive(tmp_path):
+    path = tmp_path / 'junk.hsa'
+    for junk in [b'', b'HSA', b'not an archive at all']:
+        path.write_bytes(junk)
+        with pytest.raises(ValueError):
+            archive.Archive(path)
+
+def test_damaged_archive(tmp_path):
+    path = tmp_path / 'games.hsa'
+    archive.write_archive(path, [gamelog.encode_text(lines)[0] for lines in logs(3)])
+    whole = path.read_bytes()
+    #cut short anywhere: in the logs, the index or the trailer
+    for size in [len(archive.ARCHIVE_MAGIC) + 2, len(whole) // 2, len(whole) - archive.TRAILER.size - 1,
+                 len(whole) - 1]:
+        path.write_bytes(whole[:size])
+        with pytest.raises(ValueError, match='not a hanabi-sim archive|cut short'):
+            archive.Archive(path)
+    #an index entry pointing past the logs
+    index_offset = archive.TRAILER.unpack_from(whole, len(whole) - archive.TRAILER.size)[0]
+    entry = archive.INDEX_ENTRY.pack(len(whole), 10)
+    path.write_bytes(whole[:index_offset] + entry + whole[index_offset + len(entry):])
+    with archive.Archive(path) as opened:
+        with pytest.raises(ValueError, match='game 0'):
+            opened[0]
+        assert opened[1] == gamelog.encode_text(logs(3)[1])[0]
@@ -0,0 +1,160 @@
+"""
+History, checked against the plain list of every version a game went through: whatever
+is kept whole, every version rebuilt from deltas must equal the one it stands for.
+"""
+import pytest
+
+import replay
+from game_objects import *
+from game_sim import handle_command
+from history import History, DEFAULT_SNAPSHOTS, DEFAULT_CHECKPOINT_EVERY
+from random_games import random_log
+from util import deep_sizeof
+
+SETTINGS = [(16, 32), (1, 0), (2, 4), (3, 1), (0, 5)]
+
+
+def same(version, original):
+    """
+    Whether a rebuilt version of a game matches the original in everything History keeps.
+    """
+    return version == original and version.round == original.round \
+           and version.num_in_deck == original.num_in_deck and version.over == original.over \
+           and [*version.turns_taken] == [*original.turns_taken] \
+           and [player.hand for player in version.players] == [player.hand for player in original.players] \
+           and version.discard.cards == original.discard.cards
+
+def play_through(lines, history_settings):
+    """
+    Carry out the commands of a log with a History kept as given, and alongside it the
+    list of versions along the current line of play, with the index of the current one.
+    Return the history, the versions and the current index.
+    """
+    errors = []
+    numbered = iter(enumerate(lines))
+    game = GameState(*replay.read_setup(numbered, errors))
+    history = History(game, *history_settings)
+    versions, current = [game], 0
+    for _, line in numbered:
+        choice = line.split()
+        if not choice:
+            continue
+        if choice == ['q']:
+            #quitting marks the current version over in place; it makes no new version
+            break
+        new_game, text = handle_command(choice, game, history=history)
+        match choice:
+            case ['u']:
+                current -= 1
+            case ['r']:
+                current += 1
+            case ['go', 't', turn]:
+                current = max([i for i, version in enumerate(versions)
+                               if len(version.turns_taken) == int(turn) - 1])
+            case _:
+                del versions[current + 1:]
+                versions.append(new_game)
+                current += 1
+        assert new_game is not game or choice == ['go', 't', str(len(game.turns_taken) + 1)], text
+        assert same(new_game, versions[current])
+        game = new_game
+    return history, versions, current
+
+
+@pytest.mark.parametrize('settings', SETTINGS)
+@pytest.mark.parametrize('seed', range(6))
+def test_versions_rebuilt(seed, settings):
+    history, versions, current = play_through(random_log(seed, extras=True), settings)
+    assert len(history) == len(versions)
+    assert history.game is versions[current] or same(history.game, versions[current])
+    for i, original in enumerate(versions):
+        assert same(history.version(i), original)
+
+@pytest.mark.parametrize('settings', SETTINGS)
+def test_undo_redo_goto_walk(settings):
+    history, versions, current = play_through(random_log(7, num_players=3), settings)
+    while history.current:
+        assert same(history.undo(), versions[history.current])
+    with pytest.raises(HanabiSimException):
+        history.undo()
+    while history.current < len(versions) - 1:
+        assert same(history.redo(), versions[history.current])
+    with pytest.raises(HanabiSimException):
+        history.redo()
+    for turn in [1, len(history.turn_index) // 2, len(history.turn_index)]:
+        expected = max([i for i, version in enumerate(versions) if len(version.turns_taken) == turn - 1])
+        assert same(history.goto(turn), versions[expected])
+        assert history.current == expected
+    with pytest.raises(HanabiSimException):
+        history.goto(len(history.turn_index) + 1)
+
+@pytest.mark.parametrize('settings', SETTINGS)
+def test_undo_then_branch(settings):
+    """
+    Recording a version after undoing drops the undone versions, deltas and snapshots.
+    """
+    lines = random_log(8, num_players=2)
+    turns = [line for line in lines[5:] if line.split()[0] in {'h', 'p', 'd'}]
+    history, versions, _ = play_through(lines[:5] + turns[:20], settings)
+    for _ in range(5):
+        history.undo()
+    branch_point = history.current
+    game = history.game
+    player = game.players[game.player_up]
+    other = game.players[1 - game.player_up]
+    #a hint of the first card's possible color differs from whatever was undone, and is legal
+    color = other.hand[0].colors[0]
+    positions = [p for p, card in enumerate(other.hand.hand) if card.colors == [color] or p == 0]
+    branched = player.perform_hint(other, positions, color)
+    history.record(branched)
+    assert len(history) == branch_point + 2
+    assert all([index <= branch_point + 1 for index in history.snapshots])
+    assert max(history.turn_index) == branch_point + 1
+    with pytest.raises(HanabiSimException):
+        history.redo()
+    for i in range(branch_point + 1):
+        assert same(history.version(i), versions[i])
+    assert same(history.version(branch_point + 1), branched)
+    assert same(history.undo(), versions[branch_point])
+    assert same(history.redo(), branched)
+
+@pytest.mark.parametrize('num_players', [2, 5])
+@pytest.mark.parametrize('seed', range(3))
+def test_memory_below_all_whole(seed, num_players):
+    """
+    Deltas take less than the versions they stand for: a history, as kept by default or
+    with only the first version whole, takes less memory than the list of every version.
+    """
+    lines = random_log(seed, num_players=num_players, extras=True)
+    default, versions, _ = play_through(lines, (DEFAULT_SNAPSHOTS, DEFAULT_CHECKPOINT_EVERY))
+    first_only = play_through(lines, (0, 0))[0]
+    all_whole = deep_sizeof(versions)
+    assert sum(first_only.memory()) < sum(default.memory()) < all_whole
+
+@pytest.mark.parametrize('settings', SETTINGS)
+@pytest.mark.parametrize('seed', range(4))
+def test_actions_rebuilt_before_turn(seed, settings):
+    """
+    What each action did to the cards it concerned, rebuilt from the version before its
+    turn (History.before_turn), matches the versions recorded before and after it.
+    """
+    history, versions, _ = play_through(random_log(seed, extras=True), settings)
+    hints = cards = 0
+    for turn, action in enumerate(history.log, 1):
+        index = history.turn_version(turn)
+        before = history.before_turn(turn)
+        assert same(before, versions[index])
+        assert len(versions[index + 1].turns_taken) == turn
+        if isinstance(action, HintAction):
+            target = action.targetplayer_index
+            hand, hinted = action.hands(before)
+            assert hand == versions[index].players[target].hand
+            assert hinted == versions[index + 1].players[target].hand
+            hints += 1
+        else:
+            card = action.card_state(before)
+            assert card is versions[index].players[action.player_index].hand[action.position]
+            assert card.may_be(action.card)
+            assert all([other is not card for other in versions[index + 1].players[action.player_index].hand])
+            cards += 1
+    assert hints and cards
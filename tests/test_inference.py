@@ -0,0 +1,173 @@
+"""
+The exact counts and weights of inference.py, and deduce, checked against enumerating
+every assignment of identities on small decks; and the weights LiveWeights carries from
+version to version of replayed games, against weights worked out afresh.
+"""
+import random
+from itertools import product
+from math import perm
+
+import pytest
+
+import inference
+import replay
+from game_objects import *
+from random_games import random_log
+
+
+def assignments(masks, counts):
+    """
+    Every assignment of identities to cards with the given masks which uses no more
+    copies of any identity than counts has, with the number of ways to deal it.
+    """
+    options = [[i for i in range(NUM_IDENTITIES) if mask >> i & 1] for mask in masks]
+    for identities in product(*options):
+        used = [identities.count(i) for i in range(NUM_IDENTITIES)]
+        if all([u <= c for u, c in zip(used, counts)]):
+            ways = 1
+            for u, c in zip(used, counts):
+                ways *= perm(c, u)
+            yield identities, ways
+
+def small_deck(rng, num_identities=4):
+    """
+    Outstanding counts with copies of only a few identities, and those identities.
+    """
+    identities = rng.sample(range(NUM_IDENTITIES), num_identities)
+    counts = [0] * NUM_IDENTITIES
+    for i in identities:
+        counts[i] = rng.randint(1, 3)
+    return counts, identities
+
+def dealt_masks(rng, counts, identities, num_cards):
+    """
+    Masks for cards dealt from counts (which must have copies enough), each allowing
+    the card's true identity and perhaps some others, as hints would leave them.
+    """
+    deck = [i for i in identities for _ in range(counts[i])]
+    rng.shuffle(deck)
+    return [1 << i | sum([1 << j for j in identities if rng.random() < 0.4]) for i in deck[:num_cards]]
+
+def random_masks(rng, identities, num_cards):
+    masks = []
+    for _ in range(num_cards):
+        chosen = rng.sample(identities, rng.randint(1, len(identities)))
+        #now and then a card also allows an identity with no copies left
+        if rng.random() < 0.2: chosen.append(rng.randrange(NUM_IDENTITIES))
+        masks.append(sum([1 << i for i in set(chosen)]))
+    return masks
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_count_assignments(seed):
+    rng = random.Random(seed)
+    counts, identities = small_deck(rng)
+    masks = random_masks(rng, identities, rng.randint(1, 5))
+    found = list(assignments(masks, counts))
+    assert inference.count_assignments(masks, counts, weighted=False) == len(found)
+    assert inference.count_assignments(masks, counts) == sum([ways for _, ways in found])
+
+@pytest.mark.parametrize('seed', range(40))
+def test_exact_mask_weights(seed):
+    rng = random.Random(seed)
+    counts, identities = small_deck(rng)
+    masks = random_masks(rng, identities, rng.randint(1, 5))
+    expected = [[0] * NUM_IDENTITIES for _ in masks]
+    for dealt, ways in assignments(masks, counts):
+        for card, i in enumerate(dealt):
+            expected[card][i] += ways
+    assert [list(weights) for weights in inference.exact_mask_weights(masks, counts)] == expected
+
+def test_count_assignments_full_deck():
+    counts = OutstandingCards().counts
+    masks = [ALL_IDENTITIES, COLOR_MASKS[Color.RED], NUMBER_MASKS[5]]
+    expected = sum([ways for _, ways in assignments(masks, counts)])
+    assert inference.count_assignments(masks, counts) == expected
+    assert inference.cached_count(masks, counts) == expected
+
+
+def game_with(counts, hand_masks):
+    """
+    A two player game whose outstanding counts and hands' masks are those given.
+    """
+    game = GameState(['a', 'b'], ['in_place', 'in_place'])
+    game.outstanding_cards.counts = [*counts]
+    game.outstanding_cards.total = sum(counts)
+    for player, masks in zip(game.players, hand_masks):
+        for card, mask in zip(player.hand.hand, masks):
+            card.mask = mask
+    return game
+
+@pytest.mark.parametrize('seed', range(60))
+def test_deduce_is_sound(seed):
+    """
+    Every identity a card has in some consistent deal survives deduction, and deduce
+    only finds the hints inconsistent when there is no consistent deal.
+    """
+    rng = random.Random(seed)
+    size = GameState.HAND_SIZES[2]
+    counts, identities = small_deck(rng, num_identities=rng.randint(2, 4))
+    if seed % 4:
+        #copies enough for a consistent deal, and masks which allow one
+        counts, identities = small_deck(rng, num_identities=5)
+        while sum(counts) < 2 * size:
+            counts[rng.choice(identities)] += 1
+        masks = dealt_masks(rng, counts, identities, 2 * size)
+    else:
+        masks = random_masks(rng, identities, 2 * size)
+    possible = [0] * len(masks)
+    for dealt, _ in assignments(masks, counts):
+        for card, i in enumerate(dealt):
+            possible[card] |= 1 << i
+    game = game_with(counts, [masks[:size], masks[size:]])
+    if not any(possible):
+        try: inference.deduce(game)
+        except HanabiSimException: pass
+        return
+    deduced = [mask for hand in inference.deduce(game) for mask in hand]
+    for mask, before, needed in zip(deduced, masks, possible):
+        assert not mask & ~before
+        assert not needed & ~mask
+
+def test_deduce_uses_up_copies():
+    #both copies of the red 2 are hinted down to it, so no other card can be a red 2
+    red_2, red_3, white_1 = [card_index(*card) for card in
+                             [(Color.RED, 2), (Color.RED, 3), (Color.WHITE, 1)]]
+    counts = [0] * NUM_IDENTITIES
+    counts[red_2], counts[red_3], counts[white_1] = 2, 3, 5
+    either = 1 << red_2 | 1 << red_3
+    game = game_with(counts, [[1 << red_2, 1 << red_2, either, either, either],
+                              [1 << white_1] * 5])
+    assert inference.deduce(game)[0] == [1 << red_2] * 2 + [1 << red_3] * 3
+
+def test_deduce_finds_inconsistent_hints():
+    red_2 = card_index(Color.RED, 2)
+    counts = [0] * NUM_IDENTITIES
+    counts[red_2] = 2
+    game = game_with(counts, [[1 << red_2] * 3 + [ALL_IDENTITIES] * 2, [ALL_IDENTITIES] * 5])
+    with pytest.raises(HanabiSimException):
+        inference.deduce(game)
+
+
+@pytest.mark.parametrize('seed, exact', [(seed, False) for seed in range(6)] + [(0, True), (2, True)])
+def test_live_weights_follow(seed, exact):
+    """
+    Followed through hints, plays, discards, guesses, swaps, undos, redos and gotos,
+    LiveWeights agrees with the weights of each version worked out afresh, and marks
+    as changed every player whose weights changed.
+    """
+    live = None
+    commands = set()
+    def follow(choice, before, after):
+        nonlocal live
+        if live is None: live = inference.LiveWeights(before, exact=exact)
+        new, fresh = live.follow(after), inference.LiveWeights(after, exact=exact)
+        assert [[*map(tuple, hand)] for hand in new.weights] == [[*map(tuple, hand)] for hand in fresh.weights]
+        assert new.totals == fresh.totals
+        for p in set(range(after.num_players)) - set(new.changed):
+            assert new.weights[p] == live.weights[p]
+        live = new
+        commands.add(choice[0])
+    result = replay.replay(random_log(seed, extras=True), on_change=follow)
+    assert not result.errors
+    assert commands >= {'h', 'p', 'd', 'u'} and commands & {'r', 'go'}
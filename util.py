@@ -2,6 +2,7 @@ from game_objects import *
 import random
 import readline
 import argparse
+import sys
 from enum import Enum
 
 STR_TO_COLOR_MAP = {
@@ -45,41 +46,74 @@ def trim_comment(string, comment_delimiter=COMMENT_START):
     x = string.find(comment_delimiter)
     return string if x == -1 else string[:x]
 
-def get_players(setup_choices, outfile, color_picker):
+def check_playername(playername, num_players):
     """
-    Prompt the user (or read from file) to get the players and their preferred
+    Given a player name (comment and surrounding whitespace removed) entered when
+    num_players players have already been named, return the reason it can't be
+    accepted, or None if it can.  An empty name, which ends player entry, is
+    acceptable once there are enough players.
+    """
+    #check if name too long
+    if len(playername) > PLAYERNAME_MAX_LENGTH:
+        return f'Player names must be no more than 16 characters; yours {len(playername)}.'
+    #check whether any character is whitespace
+    if True in [c in ' \t\n\r\x0b\x0c' for c in playername]:
+        return 'Player names must not have any whitespace.'
+    if (not playername and num_players < GameState.MIN_PLAYERS):
+        return f'The game needs at least {GameState.MIN_PLAYERS} players!'
+    return None
+
+class CommandSource:
+    """
+    Where commands come from: the lines of a file (or pipe), read one at a time as
+    they are needed, and then the user at the keyboard once those have run out.
+    """
+    def __init__(self, infile=None):
+        self.infile = infile
+
+    def read(self, prompt):
+        """
+        Return the next line of input, prompting the user with prompt if it must
+        come from the keyboard.  Raises EOFError if there is no more input at all.
+        """
+        if self.infile is not None:
+            line = self.infile.readline()
+            if line:
+                return line.strip()
+            self.close() #exhausted; switch to interactive input
+        return input(prompt)
+
+    def close(self):
+        if self.infile is not None and self.infile is not sys.stdin:
+            self.infile.close()
+        self.infile = None
+
+def get_players(source, outfile, color_picker):
+    """
+    Prompt the user (or read from source) to get the players and their preferred
     mode of organizing their hands
     """
     players = []
     protocols = []
     done = False
     while (not done):
-        playername = setup_choices.pop(0).strip() if setup_choices else \
-                     input(style_text(next(color_picker),
+        playername = source.read(style_text(next(color_picker),
                            f'Enter player {len(players) + 1} name (16 characters max, '\
                            f'no spaces), or nothing to proceed to game:'
                      ))
         if outfile:
             outfile.write(playername + '\n')
         playername = trim_comment(playername, COMMENT_START).strip()
-        #check if name too long
-        if len(playername) > PLAYERNAME_MAX_LENGTH:
-            print(f'Player names must be no more than 16 characters; yours {len(playername)}.')
-            continue
-        #check whether any character is whitespace
-        if True in [c in ' \t\n\r\x0b\x0c' for c in playername]:
-            print('Player names must not have any whitespace.')
-            continue
-        if (not playername and len(players) < GameState.MIN_PLAYERS):
-            print(f'The game needs at least {GameState.MIN_PLAYERS} players!')
+        problem = check_playername(playername, len(players))
+        if problem:
+            print(problem)
             continue
         if (not playername):
             return players, protocols
 
         invalid = True
         while (invalid):
-            protocol = setup_choices.pop(0).strip() if setup_choices else \
-                       input(style_text(next(color_picker),\
+            protocol = source.read(style_text(next(color_picker),\
                            f'Enter the replenishment protocol (in place|left shift|right shift)'\
                            f' for player {len(players) + 1} {playername} ("?" for help):'))
             if outfile:
@@ -250,10 +284,39 @@ def sort_stats_rows3(rows, sort):
     except: raise HanabiSimException(f'Unrecognized options "{" ".join(sort)}".')
     return #sort modifies in-place; nothing to return
 
+def deep_sizeof(obj, seen=None):
+    """
+    The bytes taken by obj and everything it refers to, each object counted once
+    (pass the same seen set to several calls to count what they share only once).
+    Classes, functions, modules, and enum members are shared by everything, and
+    are not counted.
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    pending = [obj]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, (type, Enum, type(sys), type(deep_sizeof))):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            pending += obj.keys()
+            pending += obj.values()
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            pending += obj
+        if hasattr(obj, '__dict__'):
+            pending.append(obj.__dict__)
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                if hasattr(obj, slot):
+                    pending.append(getattr(obj, slot))
+    return total
+
 #help strings.  Moved here because they are unruly and ugly
 help_general = \
     'Possible commands (full|shortcut):\nabout|a, help|?, show|s, '\
-    'play|p, hint|h, discard|d, guess|g, undo|u, swap, quit|q\n'\
+    'play|p, hint|h, discard|d, guess|g, undo|u, redo|r, goto|go, swap, quit|q\n'\
     'Call hint with these arguments for more information on format.'
 
 help_about = \
@@ -288,11 +351,27 @@ help_show = \
     'show state|s (to show some general game state)\n'\
     'show play|p (to show which cards have been played successfully)\n'\
     'show discard|d (to show which cards are out of play)\n'\
-    'show hand|h [player] (to show the hand of [player])\n'\
+    'show hand|h [player] [deduce|x] (to show the hand of [player])\n'\
     '---> [player] can be a number indicating turn order or a\n'\
     '     string which unambiguously identifies the player (defaults to player up).\n'\
     '---> Output displays for each card the round drawn (RD), possible colors,\n'\
     '     round (RU) and turn (TU) last updated, and possible numbers.\n'\
+    '---> With deduce, cards are also narrowed by what all hints and the outstanding\n'\
+    '     cards imply together; e.g. once both copies of a card are hinted, no other\n'\
+    '     card can be it.  The cards so narrowed are listed below the hand.\n'\
+    'show weights|w [player] [exact|x] (to show how likely each card in the hand of [player]\n'\
+    '     is to be each of its possible identities, given hints and the cards not yet seen)\n'\
+    '---> Without exact, each card is considered on its own; with exact, the chances come\n'\
+    '     from all deals of the whole hand, so cards competing for the same copies count.\n'\
+    'show sample|m [player] [deals] (to estimate, from random deals of all hands at once,\n'\
+    '     how likely each card in the hand of [player] is to be playable and to be each of\n'\
+    '     its likeliest identities, with 95% confidence intervals; [deals] defaults to 20000)\n'\
+    'show endgame|e [seconds] (to show, for each move open to the player up, the best score\n'\
+    '     which could be reached after it, averaged over random deals of the hidden cards;\n'\
+    '     searches for [seconds], default 5; at most 6 cards may be left in the deck)\n'\
+    '---> The scores assume every card is known, so are what perfect play could reach.\n'\
+    'show cache (to show how many inference results are stored, and how often they were reused)\n'\
+    'show memory (to show how many versions of the game are kept for undo, and the memory they take)\n'\
     'show card|c <player> <position> (to show information about a card in <player>\'s hand)\n'\
     'This shows the history of all past states the card has had, and when.\n'\
     '---> <player> can be a number indicating turn order or a\n'\
@@ -397,6 +476,21 @@ help_undo = \
     'Usage:\n'\
     'undo'
 
+help_redo = \
+    'The "redo" command, short form "r".  Used to return to a game state which was undone.\n'\
+    'Usage:\n'\
+    'redo\n'\
+    'Undone states can be returned to until a new play, discard, hint, guess, or swap is made.'
+
+help_goto = \
+    'The "goto" command, short form "go".  Used to go straight to the start of any turn\n'\
+    'taken so far (or undone and not yet replaced).\n'\
+    'Usages:\n'\
+    'goto turn|t <turn> (turns are numbered from 1 across all players)\n'\
+    'goto <round> <player> (the turn of <player> in <round>)\n'\
+    '---> The game is shown as it stood just before the turn was taken, including any\n'\
+    '     guesses and swaps made before it.  "undo" and "redo" then step from there.'
+
 help_swap = \
     'The "swap" command (no short form).  Used to '\
     'swap the positions of two cards in a player\'s hand.\n'\